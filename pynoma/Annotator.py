@@ -0,0 +1,331 @@
+"""This module contains the VariantAnnotator class, which annotates VCF and MAF files with gnomAD frequencies."""
+import csv
+import gzip
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, IO, Iterable, List, Optional, Tuple, Union
+import numpy as np
+import pandas as pd
+from pynoma.BatchSearch import VariantBatchSearch, plan_region_spans
+from pynoma.Logger import Logger
+from pynoma.Search import RegionSearch
+from pynoma.VariantColumns import VariantColumns, SEQUENCING_TYPES, split_variant_ids
+
+
+ANNOTATION_COLUMNS = ('gnomAD_AC', 'gnomAD_AN', 'gnomAD_AF', 'gnomAD_popmax', 'gnomAD_popmax_AF')
+# As in gnomAD, the popmax leaves out the bottlenecked (Amish, Ashkenazi Jewish, Finnish) and mixed populations
+POPMAX_POPULATIONS = ('afr', 'amr', 'eas', 'nfe', 'sas')
+VCF_INFO_HEADERS = {
+    'gnomAD_AC': ('Integer', "Alternate allele count in gnomAD (exomes and genomes)"),
+    'gnomAD_AN': ('Integer', "Total number of alleles in gnomAD (exomes and genomes)"),
+    'gnomAD_AF': ('Float', "Alternate allele frequency in gnomAD (exomes and genomes)"),
+    'gnomAD_popmax': ('String', "gnomAD population with the highest allele frequency"),
+    'gnomAD_popmax_AF': ('Float', "Allele frequency in the gnomAD popmax population")
+}
+Locus = Tuple[str, int, str, str]   # (chromosome, position, reference, alternative), normalized
+
+
+def normalize_variant(chromosome: Union[int, str],
+                      position: Union[int, str],
+                      reference: str,
+                      alternative: str
+                      ) -> Locus:
+    """Normalize a variant to its minimal representation, so that VCF, MAF and gnomAD notations can be matched.
+
+    The 'chr' prefix of the chromosome and the bases shared by the end and then by the start of both alleles (e.g. the
+    anchor base of VCF indels) are removed, and the position moves past the removed leading bases. Insertions end up
+    at the position of the base following them. Alleles are taken as given: MAF '-' alleles should be passed empty.
+    """
+    chromosome = str(chromosome)
+    if chromosome[:3].lower() == 'chr':
+        chromosome = chromosome[3:]
+    position = int(position)
+    reference, alternative = reference.upper(), alternative.upper()
+
+    while reference and alternative and reference[-1] == alternative[-1]:
+        reference, alternative = reference[:-1], alternative[:-1]
+    prefix = 0
+    while prefix < min(len(reference), len(alternative)) and reference[prefix] == alternative[prefix]:
+        prefix += 1
+    return chromosome, position + prefix, reference[prefix:], alternative[prefix:]
+
+
+
+class VariantAnnotator:
+
+    def __init__(self,
+                 dataset_version: Union[int, str],
+                 chunk_size: int = 10000,
+                 region_gap: int = 1000,
+                 max_workers: int = 1,
+                 batch_size: Optional[int] = 50,
+                 ignore_errors: bool = False):
+        """Constructor for the VariantAnnotator class.
+
+        Annotates VCF and MAF files with the allele count, allele number and allele frequency of each variant in gnomAD
+        (exomes and genomes combined), along with its popmax population and frequency. Files are read and written in
+        chunks of `chunk_size` rows, so memory use does not grow with the file size. The variants of each chunk are
+        grouped by locus: loci of the same chromosome that are at most `region_gap` bases apart are fetched together,
+        with a region search asking gnomAD only for the frequency fields (see `BatchSearch.plan_region_spans`), while
+        isolated substitutions, whose gnomAD ID is known, are looked up by ID, `batch_size` at a time (see
+        `VariantBatchSearch`). Region searches benefit from the region cache and the variant store, if set.
+
+        Args:
+            dataset_version: The version of the gnomAD dataset to be used. It can be either 2, 3 or hg19/h38, and should
+                match the reference genome of the annotated files.
+            chunk_size: The number of rows read, annotated and written at once. Defaults to 10000.
+            region_gap: The maximum number of bases between two loci fetched in the same region search. Defaults to
+                1000.
+            max_workers: The maximum number of requests (region searches or variant batches) run concurrently.
+                Defaults to 1.
+            batch_size: The maximum number of isolated substitutions looked up by ID in a single request. If None,
+                every locus is fetched with region searches. Defaults to 50.
+            ignore_errors: If True, the region searches that fail are logged and their variants left without
+                annotation, instead of raising. Defaults to False.
+        """
+        self.dataset_version = dataset_version
+        self.dataset_id, self.reference_genome = RegionSearch.get_dataset_id(dataset_version)
+        self.chunk_size = chunk_size
+        self.region_gap = region_gap
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.ignore_errors = ignore_errors
+
+
+    def annotate(self, input_path: str, output_path: str, input_format: Optional[str] = None) -> Dict[str, int]:
+        """Annotate a VCF or MAF file (optionally gzipped), writing the annotated file chunk by chunk.
+
+        MAF files get the gnomAD_AC, gnomAD_AN, gnomAD_AF, gnomAD_popmax and gnomAD_popmax_AF columns, left empty for
+        the variants not in gnomAD. VCF files get these INFO fields (one value per alternative allele, '.' for the
+        alleles not in gnomAD) on the records with at least one allele in gnomAD, along with their header lines.
+
+        Args:
+            input_path: The path of the file to be annotated.
+            output_path: The path of the annotated file. It is gzipped if it ends with '.gz'.
+            input_format: 'vcf' or 'maf'. Defaults to None (guessed from the file name).
+
+        Returns:
+            The number of rows written and of rows with at least one allele found in gnomAD.
+        """
+        input_format = input_format or ('vcf' if '.vcf' in input_path.lower() else 'maf')
+        if input_format not in ('vcf', 'maf'):
+            raise Exception("Invalid input format. Choose 'vcf' or 'maf'.")
+
+        header_lines = self._read_header_lines(input_path, input_format)
+        skipped = len(header_lines)
+        if input_format == 'vcf':
+            header_lines += [f'##INFO=<ID={tag},Number=A,Type={kind},Description="{description}">\n'
+                             for tag, (kind, description) in VCF_INFO_HEADERS.items()]
+
+        counts = {'rows': 0, 'annotated': 0}
+        chunks = pd.read_csv(input_path, sep='\t', skiprows=skipped, dtype=str, keep_default_na=False,
+                             na_filter=False, quoting=csv.QUOTE_NONE, chunksize=self.chunk_size)
+        with self._open(output_path, 'w') as output:
+            output.writelines(header_lines)
+            for chunk_number, chunk in enumerate(chunks):
+                if input_format == 'vcf':
+                    chunk, annotated = self._annotate_vcf_chunk(chunk)
+                else:
+                    chunk, annotated = self._annotate_maf_chunk(chunk)
+                chunk.to_csv(output, sep='\t', index=False, header=chunk_number == 0, na_rep='',
+                             float_format='%.6g', quoting=csv.QUOTE_NONE)
+                counts['rows'] += len(chunk)
+                counts['annotated'] += annotated
+                Logger.annotated_rows(counts['rows'], counts['annotated'])
+        return counts
+
+
+    def lookup(self, variants: Iterable[Tuple[Union[int, str], Union[int, str], str, str]]) -> pd.DataFrame:
+        """Get the gnomAD frequencies of (chromosome, position, reference, alternative) variants, in VCF or gnomAD
+        notation (or with empty alleles for insertions and deletions, as MAF '-' alleles).
+
+        Returns:
+            A dataframe indexed by the normalized (chromosome, position, reference, alternative) of the variants found
+                in gnomAD (see `normalize_variant`), with the annotation columns.
+        """
+        loci = list(dict.fromkeys(normalize_variant(*variant) for variant in variants))
+        by_chromosome: Dict[str, List[Locus]] = {}
+        for locus in loci:
+            by_chromosome.setdefault(locus[0], []).append(locus)
+
+        searches: List[RegionSearch] = []
+        variant_ids: List[str] = []
+        for chromosome, chromosome_loci in by_chromosome.items():
+            # gnomAD indels start at their anchor base, just before the normalized position
+            regions = [(max(position - 1, 1), position + len(reference))
+                       for _, position, reference, _ in chromosome_loci]
+            for (start, end), indexes in plan_region_spans(regions, self.region_gap):
+                _, position, reference, alternative = chromosome_loci[indexes[0]]
+                if self.batch_size and len(indexes) == 1 and reference and len(reference) == len(alternative):
+                    variant_ids.append(f"{chromosome}-{position}-{reference}-{alternative}")
+                else:
+                    searches.append(self._make_search(chromosome, start, end))
+        batches = [VariantBatchSearch(self.dataset_version, variant_ids[start:start+self.batch_size], self.batch_size)
+                   for start in range(0, len(variant_ids), self.batch_size or 1)]
+
+        with ThreadPoolExecutor(max_workers=max(self.max_workers, 1)) as executor:
+            responses = list(executor.map(self._fetch_variants, searches + batches))
+
+        frequencies = self._get_frequencies([variant for variants in responses for variant in variants])
+        return frequencies[frequencies.index.isin(loci)]
+
+
+    def _make_search(self, chromosome: str, start: int, end: int) -> RegionSearch:
+        """Build a region search asking gnomAD only for the fields of the annotations."""
+        from pynoma.Queries import build_variants_query
+        search = RegionSearch(self.dataset_version, chromosome, start, end)
+        search.query = build_variants_query('region', ('pos', 'variant_id: variantId'), ('ac', 'an'),
+                                            ('id', 'ac', 'an'), clinvar=False)
+        return search
+
+
+    def _fetch_variants(self, search: Union[RegionSearch, VariantBatchSearch]) -> List[Dict[str, Any]]:
+        """Get the variants of a region search, or of a batch of variants (as region search variants)."""
+        try:
+            if isinstance(search, VariantBatchSearch):
+                return [{'variant_id': page['variantId'], 'exome': page.get('exome'), 'genome': page.get('genome')}
+                        for page in search.get_json() if page]
+            json_data = search.get_json()
+            region = (json_data.get('data') or {}).get('region')
+            if region is None:
+                raise Exception(f"Request to gnomAD failed: {json_data.get('errors')}.")
+            return region['variants'] or []
+        except Exception as e:
+            if not self.ignore_errors:
+                raise
+            if isinstance(search, VariantBatchSearch):
+                Logger.annotation_variants_failed(len(search.variants), e)
+            else:
+                Logger.annotation_region_failed(search.chromosome, search.start, search.end, e)
+            return []
+
+
+    @staticmethod
+    def _get_frequencies(variants: List[Dict[str, Any]]) -> pd.DataFrame:
+        """Build the annotation columns of gnomAD variants, indexed by their normalized loci."""
+        index = pd.MultiIndex.from_tuples([], names=['chromosome', 'position', 'reference', 'alternative'])
+        if not variants:
+            return pd.DataFrame({column: [] for column in ANNOTATION_COLUMNS}, index=index)
+
+        columns = VariantColumns(variants)
+        variant_ids = list(columns.fields['variant_id'])
+        loci = [normalize_variant(*pieces) for pieces in zip(*split_variant_ids(variant_ids))]
+        index = pd.MultiIndex.from_tuples(loci, names=index.names)
+
+        allele_count = sum(columns.sequencing[sequencing_type]['ac'] for sequencing_type in SEQUENCING_TYPES)
+        allele_number = sum(columns.sequencing[sequencing_type]['an'] for sequencing_type in SEQUENCING_TYPES)
+        frequency = np.divide(allele_count, allele_number, out=np.full(len(variants), np.nan), where=allele_number > 0)
+
+        # Frequencies of the popmax populations, -1 where a population has no alleles
+        popmax_ids = [pop_id for pop_id in columns.population_ids if pop_id in POPMAX_POPULATIONS]
+        positions = [columns.population_ids.index(pop_id) for pop_id in popmax_ids]
+        population_ac = sum(columns.population_matrix(sequencing_type, 'ac')[:, positions]
+                            for sequencing_type in SEQUENCING_TYPES)
+        population_an = sum(columns.population_matrix(sequencing_type, 'an')[:, positions]
+                            for sequencing_type in SEQUENCING_TYPES)
+        population_af = np.divide(population_ac, population_an, out=np.full(population_ac.shape, -1.0),
+                                  where=population_an > 0)
+        if popmax_ids:
+            best = population_af.argmax(axis=1)
+            popmax_af = population_af[np.arange(len(variants)), best]
+            popmax = np.where(popmax_af >= 0, np.array(popmax_ids, dtype=object)[best], None)
+        else:
+            popmax_af = np.full(len(variants), -1.0)
+            popmax = np.full(len(variants), None, dtype=object)
+
+        frequencies = pd.DataFrame({
+            'gnomAD_AC': pd.array(allele_count, dtype='Int64'),
+            'gnomAD_AN': pd.array(allele_number, dtype='Int64'),
+            'gnomAD_AF': frequency,
+            'gnomAD_popmax': popmax,
+            'gnomAD_popmax_AF': np.where(popmax_af >= 0, popmax_af, np.nan)
+        }, index=index)
+        return frequencies[~frequencies.index.duplicated()]
+
+
+    def _annotate_maf_chunk(self, chunk: pd.DataFrame) -> Tuple[pd.DataFrame, int]:
+        columns = {column.lower(): column for column in chunk.columns}
+        reference = chunk[columns['reference_allele']]
+        # The alternative allele is the tumor allele differing from the reference
+        alternative = chunk[columns['tumor_seq_allele2']].where(chunk[columns['tumor_seq_allele2']] != reference,
+                                                                 chunk[columns['tumor_seq_allele1']])
+        # MAF insertions start at the base preceding them, deletions at their first deleted base
+        position = pd.to_numeric(chunk[columns['start_position']]) + (reference == '-')
+        variants = list(zip(chunk[columns['chromosome']], position, reference.replace('-', ''),
+                            alternative.replace('-', '')))
+
+        frequencies = self.lookup(variants)
+        loci = pd.MultiIndex.from_tuples([normalize_variant(*variant) for variant in variants],
+                                         names=frequencies.index.names)
+        annotations = frequencies.reindex(loci)
+        for column in ANNOTATION_COLUMNS:
+            chunk[column] = annotations[column].to_numpy()
+        return chunk, int(annotations['gnomAD_AN'].notna().sum())
+
+
+    def _annotate_vcf_chunk(self, chunk: pd.DataFrame) -> Tuple[pd.DataFrame, int]:
+        chromosome, position, reference, alternatives, info = (chunk.columns[i] for i in (0, 1, 3, 4, 7))
+        alleles = chunk[alternatives].str.split(',')
+        rows = np.repeat(np.arange(len(chunk)), alleles.str.len())
+        variants = list(zip(chunk[chromosome].to_numpy()[rows], chunk[position].to_numpy()[rows],
+                            chunk[reference].to_numpy()[rows], [allele for row in alleles for allele in row]))
+        # Missing ('.'), spanning deletion ('*') and symbolic ('<DEL>', ...) alleles are not looked up
+        valid = np.fromiter((allele not in ('.', '*') and not allele.startswith('<') for *_, allele in variants),
+                            dtype=bool, count=len(variants))
+        variants = [variant for variant, keep in zip(variants, valid) if keep]
+
+        frequencies = self.lookup(variants)
+        loci = pd.MultiIndex.from_tuples([normalize_variant(*variant) for variant in variants],
+                                         names=frequencies.index.names)
+        annotations = frequencies.reindex(loci)
+        found = np.zeros(len(valid), dtype=bool)
+        found[valid] = annotations['gnomAD_AN'].notna().to_numpy()
+
+        # One value per alternative allele ('.' for the ones not looked up), joined by commas, for the records with
+        # any allele found
+        values = {}
+        for column in ANNOTATION_COLUMNS:
+            values[column] = np.full(len(valid), '.', dtype=object)
+            values[column][valid] = [self._format_info_value(value) for value in annotations[column]]
+        fields: List[List[str]] = [[] for _ in range(len(chunk))]
+        for i, row in enumerate(rows):
+            fields[row].append(i)
+        annotated = 0
+        info_values = list(chunk[info])
+        for row, indexes in enumerate(fields):
+            if not found[indexes].any():
+                continue
+            annotated += 1
+            tags = [f"{column}={','.join(values[column][i] for i in indexes)}" for column in ANNOTATION_COLUMNS]
+            current = info_values[row]
+            info_values[row] = ';'.join(tags if current in ('', '.') else [current] + tags)
+        chunk[info] = info_values
+        return chunk, annotated
+
+
+    @staticmethod
+    def _format_info_value(value: Any) -> str:
+        if value is None or value is pd.NA or (isinstance(value, float) and np.isnan(value)):
+            return '.'
+        if isinstance(value, float):
+            return f"{value:.6g}"
+        return str(value)
+
+
+    @classmethod
+    def _read_header_lines(cls, path: str, input_format: str) -> List[str]:
+        """Get the lines before the column header: the '##' meta-information of VCF, the '#' comments of MAF."""
+        prefix = '##' if input_format == 'vcf' else '#'
+        lines = []
+        with cls._open(path, 'r') as file:
+            for line in file:
+                if not line.startswith(prefix):
+                    break
+                lines.append(line)
+        return lines
+
+
+    @staticmethod
+    def _open(path: str, mode: str) -> IO[str]:
+        if path.endswith('.gz'):
+            return gzip.open(path, mode + 't', newline='')
+        return open(path, mode, newline='')
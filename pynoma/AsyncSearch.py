@@ -0,0 +1,147 @@
+"""This module contains the asyncio counterparts of the Search classes."""
+import asyncio
+from time import time
+from typing import Any, Optional, Union, Dict
+from pynoma.Search import RegionSearch, GeneSearch, TranscriptSearch, VariantSearch
+from pynoma.Transport import AsyncTransport
+
+
+class AsyncSearch:
+    """Mixin turning a Search class into a coroutine-based one.
+
+    The queries, their variables and the DataManager post-processing are inherited from the synchronous class; only
+    the request itself is awaited, so many searches can be kept in flight by a single event loop, e.g.:
+
+        results = await asyncio.gather(*(AsyncGeneSearch(3, gene).get_data() for gene in genes))
+    """
+
+    async_transport = AsyncTransport()   # pooled connections shared by every async search in the process
+
+    async def request_gnomad(self,
+                             variables: Union[str, tuple],
+                             retry_on_429: bool = True,
+                             retry_sleep: Optional[float] = None
+                             ) -> Dict[str, Any]:
+        """Send a POST request to the gnomAD API without blocking the event loop. See `Search.request_gnomad`.
+
+        Args:
+            variables: The variables to be used in the query. See examples in the Queries file.
+            retry_on_429: If True, the request will be retried if gnomAD complains about too many requests.
+            retry_sleep: If given, the fixed number of seconds every search sharing the rate limiter waits before
+                retrying after gnomAD complains about too many requests, instead of the retry policy backoff.
+
+        Returns:
+            The response JSON from the gnomAD API request.
+        """
+        payload = self._build_payload(variables)
+        cache_key, json_data = self._get_cached_response(payload)
+        if json_data is not None:
+            return json_data
+
+        started = time()
+        attempt = 0
+        while True:
+            wait = self.rate_limiter.reserve()
+            await asyncio.sleep(wait)
+            self._add_time_waiting(wait)
+            try:
+                response = await self.async_transport.post(self.end_point, data=payload)
+            except self.retry_policy.retryable_errors as error:
+                response = error
+            else:
+                if response.ok:
+                    return self._store_response(cache_key, response.json())
+
+            delay = self._retry_delay(response, attempt, started, retry_on_429, retry_sleep)
+            if delay:
+                await asyncio.sleep(delay)
+                self._add_time_waiting(delay)
+            attempt += 1
+
+
+    async def get_json(self) -> Dict[str, Any]:
+        """Get the JSON data from the gnomAD API (or from the variant store, if it covers the search)."""
+        stored = self._get_stored_json()
+        if stored is not None:
+            return stored
+        return await self.request_gnomad(self._get_variables())
+
+
+    async def get_data(self, *args, **kwargs):
+        """Get the search data from the gnomAD API. Takes the same arguments as the synchronous `get_data`."""
+        self._set_projection(*args, **kwargs)
+        return self._process_json(await self.get_json(), *args, **kwargs)
+
+
+    @classmethod
+    def set_async_transport(cls, transport: AsyncTransport):
+        """Replace the transport shared by all asynchronous searches.
+
+        Args:
+            transport: The AsyncTransport object to be used by every asynchronous search from now on.
+        """
+        AsyncSearch.async_transport = transport
+        return
+
+
+
+class AsyncRegionSearch(AsyncSearch, RegionSearch):
+    """Asynchronous RegionSearch: `df, clinical_df = await AsyncRegionSearch(3, 4, 1002741, 1002771).get_data()`."""
+
+    async def get_json(self) -> Dict[str, Any]:
+        """Get the JSON data from the gnomAD API, requesting the region tiles (not in the region cache) concurrently."""
+        stored = self._get_stored_json()
+        if stored is not None:
+            return stored
+        ranges = self._get_missing_ranges()
+        while True:
+            tiles = [tile for start, end in ranges for tile in self._get_tiles(start, end)]
+            if len(tiles) == 1 and self.region_cache is None:
+                return await super().get_json()
+            responses = await asyncio.gather(*(self.request_gnomad(self._get_variables(*tile)) for tile in tiles))
+            json_data = self._build_region_response(ranges, list(responses))
+            if json_data is not None:
+                return json_data
+            # Cached parts of the region were evicted in the meantime, so the whole region is requested instead
+            ranges = [(int(self.start), int(self.end))]
+
+
+
+class AsyncGeneSearch(AsyncSearch, GeneSearch):
+    """Asynchronous GeneSearch: `df, clinical_df = await AsyncGeneSearch(3, "IDUA").get_data()`."""
+
+    async def get_ensembl_id(self) -> bool:
+        """Check whether the gene name provided by the user is valid.
+
+        Returns:
+            True if the gene name is valid, False otherwise.
+        """
+        gene_ens_id = self.gene_ids.get(self.reference_genome, self.gene)
+        if gene_ens_id:
+            return self._use_ensembl_id(gene_ens_id)
+        json_data = await self.request_gnomad((self.gene, self.reference_genome))
+        return self._set_ensembl_id(json_data)
+
+
+    async def get_json(self) -> Dict[str, Any]:
+        """Get the JSON data from the gnomAD API. See `GeneSearch.get_json`."""
+        if not self.gene_ens_id and not await self.get_ensembl_id():
+            return {'data': {'gene': None}}
+        return await super().get_json()
+
+
+    async def get_data(self, standard: bool = True, additional_population_info: bool = False):
+        """Get the gene data from the gnomAD API. See `GeneSearch.get_data`."""
+        if not self.gene_ens_id and not await self.get_ensembl_id():
+            return (None, None)
+        return await super().get_data(standard, additional_population_info)
+
+
+
+class AsyncTranscriptSearch(AsyncSearch, TranscriptSearch):
+    """Asynchronous TranscriptSearch: `df, clinical_df = await AsyncTranscriptSearch(3, transcript).get_data()`."""
+
+
+
+class AsyncVariantSearch(AsyncSearch, VariantSearch):
+    """Asynchronous VariantSearch: `df, metadata = await AsyncVariantSearch(3, '4-1002747-G-A').get_data()`."""
@@ -0,0 +1,351 @@
+"""This module contains the BatchSearch class, which sends many searches of the same kind in a single request."""
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import pandas as pd
+from pynoma.DataManager import DataManager
+from pynoma.Logger import Logger
+from pynoma.RegionCache import RegionCache
+from pynoma.Search import Search, GeneSearch, RegionSearch
+
+
+QUERY_PATTERN = re.compile(r'^\s*query\s+(\w+)\s*\((.*?)\)\s*\{(.*)\}\s*$', re.DOTALL)
+VARIABLE_PATTERN = re.compile(r'\$(\w+)')
+RSID_PATTERN = re.compile(r'^rs\d+$', re.IGNORECASE)
+
+
+def alias_query(query: str, count: int) -> Tuple[str, str]:
+    """Repeat the single top-level field of a query template `count` times under the aliases q0, q1, ...
+
+    The variables of the i-th copy are suffixed with `_i` (e.g. `$geneId` becomes `$geneId_3`), matching the keys
+    built by `alias_variables`.
+
+    Args:
+        query: A query template from the Queries file.
+        count: The number of aliased copies.
+
+    Returns:
+        The aliased query and the name of the top-level field (e.g. 'gene'), under which each alias result should be
+            put back to be processed as a regular search response.
+    """
+    match = QUERY_PATTERN.match(query)
+    if not match:
+        raise Exception("Query template could not be parsed for batching.")
+    name, params, body = match.groups()
+    field = re.match(r'\s*(\w+)', body).group(1)
+
+    aliased_params = []
+    aliased_bodies = []
+    for i in range(count):
+        aliased_params.append(VARIABLE_PATTERN.sub(rf'$\1_{i}', params.strip()))
+        aliased_bodies.append(f"  q{i}: " + VARIABLE_PATTERN.sub(rf'$\1_{i}', body.strip()))
+
+    aliased_query = f"query {name}Batch({', '.join(aliased_params)}) {{\n" + "\n".join(aliased_bodies) + "\n}"
+    return aliased_query, field
+
+
+def alias_variables(variables: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge the variables of each aliased copy of a query, suffixing the i-th ones with `_i`."""
+    return {f"{key}_{i}": value for i, copy_variables in enumerate(variables) for key, value in copy_variables.items()}
+
+
+
+class BatchSearch(Search):
+
+    def __init__(self, search_objects: Iterable[Search], batch_size: int = 20):
+        """Constructor for the BatchSearch class.
+
+        The searches are sent in chunks of `batch_size`, each chunk as a single GraphQL request holding one aliased
+        copy of the search query per search. The combined response is then split back and processed by each search
+        object, exactly as its own `get_data` would do.
+
+        Args:
+            search_objects: The searches to be run. They should all be of the same kind (e.g. all GeneSearch objects)
+                and use the same gnomAD version.
+            batch_size: The maximum number of searches sent in a single request. Defaults to 20.
+        """
+        self.searches = list(search_objects)
+        if not self.searches:
+            raise Exception("There are no searches to batch.")
+        if len({(type(obj), obj.dataset_id) for obj in self.searches}) > 1:
+            raise Exception("All the batched searches should be of the same kind and use the same gnomAD version.")
+
+        super().__init__(self.searches[0].dataset_id, "", "%s")
+        self.batch_size = batch_size
+
+
+    def get_data(self, *args, **kwargs) -> List[Tuple[Any, Any]]:
+        """Get the data of every search from the gnomAD API.
+
+        Takes the same arguments as the `get_data` method of the batched searches.
+
+        Returns:
+            A list with the output of each search, in the same order as the searches were given.
+        """
+        results: List[Any] = [None] * len(self.searches)
+        resolve_gene_ids(self.searches)
+
+        pending: Dict[str, List[int]] = {}
+        for i, obj in enumerate(self.searches):
+            if isinstance(obj, GeneSearch) and not obj.gene_ens_id:
+                results[i] = (None, None)
+            else:
+                obj._set_projection(*args, **kwargs)
+                pending.setdefault(obj.query, []).append(i)
+
+        chunks = [indexes[start:start+self.batch_size]
+                  for indexes in pending.values() for start in range(0, len(indexes), self.batch_size)]
+        for chunk_number, chunk in enumerate(chunks):
+            Logger.batch_searching(chunk_number+1, len(chunks))
+            searches = [self.searches[i] for i in chunk]
+            for i, output in zip(chunk, self._get_chunk_data(searches, *args, **kwargs)):
+                results[i] = output
+        return results
+
+
+    def _get_chunk_data(self, searches: List[Search], *args, **kwargs) -> List[Tuple[Any, Any]]:
+        """Send a chunk of searches sharing the same query as a single aliased request and split its response."""
+        self.query, field = alias_query(searches[0].query, len(searches))
+        variables = alias_variables([json.loads(obj.query_vars % obj._get_variables()) for obj in searches])
+
+        json_data = self.request_gnomad((json.dumps(variables),))
+        if not json_data.get('data'):
+            raise Exception(f"Batch request to gnomAD failed: {json_data.get('errors')}.")
+
+        outputs = []
+        for i, obj in enumerate(searches):
+            data = json_data['data'].get(f"q{i}")
+            if data is None:
+                # A search gnomAD failed on comes as a null alias, along with its errors
+                errors = [error for error in json_data.get('errors') or []
+                          if (error.get('path') or [None])[0] == f"q{i}"]
+                Logger.batch_item_failed(f"{type(obj).__name__}{obj._get_variables()}", errors)
+                outputs.append((None, None))
+            else:
+                outputs.append(obj._process_json({'data': {field: data}}, *args, **kwargs))
+        return outputs
+
+
+
+class VariantBatchSearch(Search):
+
+    def __init__(self, dataset_version: Union[int, str], variants: Iterable[str], batch_size: int = 50):
+        """Constructor for the VariantBatchSearch class.
+
+        Looks up many variants at once: the population data of `batch_size` variants is fetched in each request, as
+        aliased copies of a query holding only that data, and all the variants are stacked in a single dataframe.
+
+        Args:
+            dataset_version: The version of the gnomAD dataset to be used. It can be either 2, 3 or hg19/h38.
+            variants: The variant IDs (e.g. 4-1002747-G-A) and/or rsIDs (e.g. rs1234) to search for. Repeated
+                variants are searched only once.
+            batch_size: The maximum number of variants fetched in a single request. Defaults to 50.
+        """
+        from pynoma.Queries import variant_populations_search
+        super().__init__(dataset_version, variant_populations_search, "%s")
+        self.variants = list(dict.fromkeys(variants))
+        self.batch_size = batch_size
+
+
+    def _get_variables(self, variant: str) -> Dict[str, str]:
+        """Get the query variables of a variant, searched by rsID or by variant ID."""
+        key = 'rsid' if RSID_PATTERN.match(variant) else 'variantId'
+        return {'datasetId': self.dataset_id, key: variant}
+
+
+    def get_json(self) -> List[Optional[Dict[str, Any]]]:
+        """Get the data of every variant from the gnomAD API.
+
+        Returns:
+            A list with the 'variant' data of each variant, in the same order as the variants were given, or None for
+                the variants not found.
+        """
+        from pynoma.Queries import variant_populations_search
+        pages: List[Optional[Dict[str, Any]]] = []
+        chunks = [self.variants[start:start+self.batch_size] for start in range(0, len(self.variants), self.batch_size)]
+        for chunk_number, chunk in enumerate(chunks):
+            Logger.batch_searching(chunk_number+1, len(chunks))
+            self.query, _ = alias_query(variant_populations_search, len(chunk))
+            variables = alias_variables([self._get_variables(variant) for variant in chunk])
+            json_data = self.request_gnomad((json.dumps(variables),))
+
+            # Variants not found come as null aliases, along with an error each
+            if not json_data.get('data') and json_data.get('errors'):
+                raise Exception(f"Batch request to gnomAD failed: {json_data.get('errors')}.")
+            for i, variant in enumerate(chunk):
+                page = (json_data.get('data') or {}).get(f"q{i}")
+                if not page:
+                    Logger.variant_not_found(variant)
+                pages.append(page)
+        return pages
+
+
+    def get_data(self, raw: bool = False) -> Union[pd.DataFrame, List[Optional[Dict[str, Any]]], None]:
+        """Get the population data of every variant from the gnomAD API.
+
+        Args:
+            raw: If True, the list of raw variant data (see `get_json`) will be returned. Defaults to False.
+
+        Returns:
+            A dataframe stacking the population table of each variant found (as in the standard dataframe of a
+                variant search), indexed by (variant_id, population), or None if no variant is found.
+        """
+        pages = self.get_json()
+        if raw:
+            return pages
+
+        found = [page for page in pages if page]
+        if not found:
+            return None
+        self.dm = DataManager({'data': {'variants': {'variants': found}}}, self.dataset_id,
+                              second_level_key='variants')
+        return self.dm.get_variants_population_df()
+
+
+
+def prefetch_gene_ids(genes: Iterable[str],
+                      dataset_version: Union[int, str] = 3,
+                      batch_size: int = 100
+                      ) -> Dict[str, Optional[str]]:
+    """Resolve the Ensembl IDs of many gene symbols with aliased `gene_id` queries.
+
+    The IDs are stored in the map shared by all gene searches (`GeneSearch.gene_ids`), so that the later GeneSearch
+    objects of these genes skip their own lookup request. Symbols already in the map are not requested again.
+
+    Args:
+        genes: The gene symbols to be resolved.
+        dataset_version: The version of the gnomAD dataset to be used. It can be either 2, 3 or hg19/h38.
+        batch_size: The maximum number of symbols resolved in a single request. Defaults to 100.
+
+    Returns:
+        A dictionary with the Ensembl ID of each gene symbol, or None for the symbols not found.
+    """
+    from pynoma.Queries import gene_id
+
+    _, reference_genome = Search.get_dataset_id(dataset_version)
+    genes = list(dict.fromkeys(genes))
+    missing = [gene for gene in genes if not GeneSearch.gene_ids.get(reference_genome, gene)]
+
+    for start in range(0, len(missing), batch_size):
+        chunk = missing[start:start+batch_size]
+        query, _ = alias_query(gene_id, len(chunk))
+        variables = alias_variables([{'query': gene, 'referenceGenome': reference_genome} for gene in chunk])
+        json_data = Search(dataset_version, query, "%s").request_gnomad((json.dumps(variables),))
+        if not json_data.get('data'):
+            raise Exception(f"Batch request to gnomAD failed: {json_data.get('errors')}.")
+
+        resolved = {}
+        for i, gene in enumerate(chunk):
+            found = json_data['data'][f"q{i}"]
+            if found:
+                resolved[gene] = found[0]['ensembl_id']
+            else:
+                Logger.no_gene_found_with_given_name(gene)
+        GeneSearch.gene_ids.update(reference_genome, resolved)
+
+    return {gene: GeneSearch.gene_ids.get(reference_genome, gene) for gene in genes}
+
+
+
+def resolve_gene_ids(search_objects: Iterable[Any], batch_size: int = 100):
+    """Resolve, in bulk, the Ensembl IDs of the gene searches among `search_objects` that were not resolved yet.
+
+    Each distinct gene symbol is requested at most once per gnomAD version (see `prefetch_gene_ids`). Gene searches
+    whose symbol is not found are left unresolved, and their `get_data` returns (None, None).
+
+    Args:
+        search_objects: Search objects of any kind; only the GeneSearch ones are resolved.
+        batch_size: The maximum number of symbols resolved in a single request. Defaults to 100.
+    """
+    unresolved: Dict[str, List[GeneSearch]] = {}
+    for obj in search_objects:
+        if isinstance(obj, GeneSearch) and not obj.gene_ens_id:
+            unresolved.setdefault(obj.dataset_id, []).append(obj)
+
+    for dataset_id, gene_searches in unresolved.items():
+        gene_ids = prefetch_gene_ids([obj.gene for obj in gene_searches], dataset_id, batch_size)
+        for obj in gene_searches:
+            if gene_ids[obj.gene]:
+                obj._use_ensembl_id(gene_ids[obj.gene])
+    return
+
+
+
+def plan_region_spans(regions: List[Tuple[int, int]], max_gap: int = 1000) -> List[Tuple[Tuple[int, int], List[int]]]:
+    """Coalesce the (start, end) regions that overlap or are at most `max_gap` bases apart into fetch spans.
+
+    Args:
+        regions: The (start, end) positions of the regions, all in the same chromosome.
+        max_gap: The maximum number of bases between two regions fetched together. Defaults to 1000.
+
+    Returns:
+        The (start, end) of each span, sorted by position, along with the indexes of the regions it covers.
+    """
+    spans: List[Tuple[Tuple[int, int], List[int]]] = []
+    for i in sorted(range(len(regions)), key=lambda i: regions[i]):
+        start, end = regions[i]
+        if spans and start <= spans[-1][0][1] + max_gap + 1:
+            (span_start, span_end), indexes = spans[-1]
+            spans[-1] = ((span_start, max(span_end, end)), indexes + [i])
+        else:
+            spans.append(((start, end), [i]))
+    return spans
+
+
+
+def coalesce_region_searches(search_objects: Iterable[Any],
+                             standard: bool = True,
+                             additional_population_info: bool = False,
+                             max_gap: int = 1000,
+                             max_workers: int = 1
+                             ) -> List[RegionSearch]:
+    """Fetch nearby region searches together, in a few spans, before they are run.
+
+    The region searches among `search_objects` not covered by the variant store are grouped by dataset, chromosome
+    and query fields, and coalesced with `plan_region_spans`. Each span covering more than one region is fetched once
+    into a region cache (the one shared by all region searches, if set, or a new one) given to the searches it covers,
+    whose `get_data` then slices their own variants from it without any request. Spans that fail to be fetched are
+    logged and left to their searches.
+
+    Args:
+        search_objects: Search objects of any kind; only the RegionSearch ones are coalesced.
+        standard: The `standard` argument the searches will be run with.
+        additional_population_info: The `additional_population_info` argument the searches will be run with.
+        max_gap: The maximum number of bases between two regions fetched together. Defaults to 1000.
+        max_workers: The maximum number of spans fetched concurrently. Defaults to 1.
+
+    Returns:
+        The searches given the region cache, whose `region_cache` attribute should be deleted once they are run.
+    """
+    groups: Dict[Tuple[str, str, str], List[RegionSearch]] = {}
+    for obj in search_objects:
+        if isinstance(obj, RegionSearch) and not obj._is_stored():
+            obj._set_projection(standard, additional_population_info)
+            groups.setdefault((obj.dataset_id, obj.chromosome, obj.query), []).append(obj)
+
+    cache = RegionSearch.region_cache or RegionCache(max_variants=None)
+    spans: List[RegionSearch] = []
+    coalesced: List[RegionSearch] = []
+    for (dataset_id, chromosome, _), searches in groups.items():
+        regions = [(int(obj.start), int(obj.end)) for obj in searches]
+        for (start, end), indexes in plan_region_spans(regions, max_gap):
+            if len(indexes) < 2:
+                continue
+            first = searches[indexes[0]]
+            span = RegionSearch(dataset_id, chromosome, start, end, first.tile_size, first.tile_workers)
+            span._set_projection(standard, additional_population_info)
+            span.region_cache = cache
+            spans.append(span)
+            for i in indexes:
+                searches[i].region_cache = cache
+                coalesced.append(searches[i])
+
+    def fetch_span(span: RegionSearch):
+        try:
+            span.get_json()
+        except Exception as e:
+            Logger.region_span_failed(span.chromosome, span.start, span.end, e)
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        list(executor.map(fetch_span, spans))
+    return list(dict.fromkeys(coalesced))   # a search given more than once is returned once
@@ -1,5 +1,6 @@
+import numpy as np
 import pandas as pd
-from copy import deepcopy
+from pynoma.VariantColumns import VariantColumns, SEQUENCING_TYPES, split_variant_ids
 
 
 POPULATION_ID_MAP = {
@@ -33,101 +34,291 @@ SUBPOPULATION_ID_MAP = {
             'ONF': 'Other'
         }
 
+# Precomputed lookup of the name of each piece of a population ID (e.g.
+# 'nfe_swe' -> 'European (non-Finnish)' and 'Swedish')
+POPULATION_NAMES = {**SUBPOPULATION_ID_MAP, **POPULATION_ID_MAP}
+SEX_IDS = {'XX', 'XY', 'FEMALE', 'MALE'}
+
 
 
 class DataManager:
 
+    # Each output (view) of the DataManager is only built when first accessed
+    # (e.g. through the standard_df attribute), and then kept
+    VIEWS = ('raw', 'standard', 'clinical', 'population', 'population_table', 'variants_population', 'metadata')
+    POPULATION_VIEWS = ('population', 'population_table', 'variants_population')
+
     def __init__(self, json_data, gnomad_version:str, variant_search=False, second_level_key='region'):
         self.json_data = json_data
         self.variant_search = variant_search
         self.gnomad_version = gnomad_version 
         self.second_level_key = second_level_key
 
-        self.raw_df = None
-        self.clinical_df = None
-        self.standard_df = None
-        self.variant_metadata = None  # Used in variant searches
-        self._process_raw_json()
+        self._columns = None  # Columnar variants data, used in region, gene and transcript searches
+        self._views = {}
+
+
+    @property
+    def raw_df(self):
+        return self._get_view('raw')
+
+    @property
+    def standard_df(self):
+        return self._get_view('standard')
+
+    @property
+    def clinical_df(self):
+        return self._get_view('clinical')
+
+    @property
+    def variant_metadata(self):  # Used in variant searches
+        return self._get_view('metadata')
+
+    @property
+    def columns(self):
+        if self._columns is None and not self.variant_search:
+            self._check_not_released('columns')
+            self._columns = VariantColumns(self.json_data['data'][self.second_level_key]['variants'])
+        return self._columns
+
+
+    def _get_view(self, view):
+        if view not in self._views:
+            self._check_not_released(view)
+            if view in self.POPULATION_VIEWS:
+                self._check_population_counts(view)
+            builders = {
+                'raw': self._build_raw_df,
+                'standard': self.__build_variant_search_standard_df if self.variant_search else self._process_raw_df,
+                'clinical': self._build_clinical_df,
+                'population': self._process_populations_frequency,
+                'population_table': self._process_population_table,
+                'variants_population': self._process_variants_population_df,
+                'metadata': self.__extract_variant_metadata
+            }
+            self._views[view] = builders[view]()
+        return self._views[view]
+
+
+    def _check_not_released(self, view):
+        if self.json_data is None:
+            raise Exception(f"The {view} data was not built before the DataManager released the response JSON.")
+
+
+    # The standard output of region, gene and transcript searches only
+    # requests the population fields it needs (their IDs, ac_hom and ac_hemi), so the
+    # population views would be built from missing allele counts
+    def _check_population_counts(self, view):
+        if self.columns.population_ids and not {'ac', 'an'} <= self.columns.population_fields:
+            raise Exception(f"The {view} data needs the population allele counts, which were not requested. "
+                            "Use get_data with additional_population_info=True or standard=False.")
+
+
+    # Drops the response JSON (and the data parsed from it), keeping only the
+    # views already built and the ones given (e.g. release('standard',
+    # 'clinical')), which are built first. Any other view is unavailable
+    # afterwards. Useful to cut the memory held by searches in long batch runs
+    def release(self, *views):
+        for view in views:
+            if view not in self.VIEWS:
+                raise Exception(f"View should be one of: {', '.join(self.VIEWS)}")
+            self._get_view(view)
+        self.json_data = None
+        self._columns = None
+        return
 
 
-    def _process_raw_json(self):
+    # The raw dataframe is assembled from the parsed columns, with the
+    # original exome/genome data as its (not copied) nested columns
+    def _build_raw_df(self):
         if self.variant_search:
-            self.__process_variant_search_data()
-        
-        else:
-            clinical_var = self.json_data['data'][self.second_level_key]['clinvar_variants']
-            variants = self.json_data['data'][self.second_level_key]['variants']
-            self.raw_df = pd.DataFrame(variants)
-            self.clinical_df = pd.DataFrame(clinical_var)
-        return
+            return None
+        columns = {key: self.columns.fields[key] if key in self.columns.fields
+                        else self.columns.sequencing[key]['blocks']
+                   for key in self.columns.keys}
+        return pd.DataFrame(columns, index=pd.RangeIndex(self.columns.n_variants))
+
+
+    def _build_clinical_df(self):
+        if self.variant_search:
+            return None
+        return pd.DataFrame(self.json_data['data'][self.second_level_key]['clinvar_variants'])
 
 
     
     def process_standard_dataframe(self):
-        self._process_raw_df()
+        self._get_view('standard')
         return
 
     
     # dataframe_type: either 'standard' or 'raw' (it is not binary because 
     # maybe more output dataframe types will be added in the future)
-    def get_additional_pop_info_df(self, dataframe_type:str):
+    # formatted: if True, the frequencies are added as "{:e}"-formatted strings
+    # (for display) instead of numbers
+    def get_additional_pop_info_df(self, dataframe_type:str, formatted=False):
+
+        populations_freq_column = self._get_view('population')['Allele Frequency']
+        if formatted:
+            populations_freq_column = pd.DataFrame(
+                np.char.mod('%e', populations_freq_column.to_numpy()).astype(object),
+                index=populations_freq_column.index, columns=populations_freq_column.columns)
 
-        populations_freq_column = self._process_populations_frequency()
         if dataframe_type == 'standard':
             return self._add_populations_freq_column(populations_freq_column, self.standard_df)
         elif dataframe_type == 'raw':
             return self._add_populations_freq_column(populations_freq_column, self.raw_df)
         else:
-            raise("Dataframe type should be either 'raw' or 'standard'")
+            raise Exception("Dataframe type should be either 'raw' or 'standard'")
 
 
-    
-    def _process_populations_frequency(self):
-        
-        populations_freq_column = {}
-        for pop_id in POPULATION_ID_MAP:
-            populations_freq_column[pop_id] = []
-
-        for row in self.raw_df.loc[:, ['genome','exome']].iterrows():
-            
-            genome_variant = row[1]['genome']
-            exome_variant = row[1]['exome']
-
-            if genome_variant:
-                if exome_variant:   # thre's genome and exome data
-                    for i in range(len(genome_variant['populations'])):
-                        ac = exome_variant['populations'][i]['ac'] + genome_variant['populations'][i]['ac']
-                        an = exome_variant['populations'][i]['an'] + genome_variant['populations'][i]['an']
-                        pop_id = genome_variant['populations'][i]['id']
-                        pop_allele_freq = ac/an if an else 0
-                        populations_freq_column[pop_id.upper()].append("{:e}".format(pop_allele_freq))
-                
-                else:   # there's only genome data
-                    for i in range(len(genome_variant['populations'])):
-                        ac = genome_variant['populations'][i]['ac']
-                        an = genome_variant['populations'][i]['an']
-                        pop_id = genome_variant['populations'][i]['id']
-                        pop_allele_freq = ac/an if an else 0
-                        populations_freq_column[pop_id.upper()].append("{:e}".format(pop_allele_freq))
-        
+    # Returns a dataframe with a row for each variant (in the same order of the
+    # other dataframes) and the allele count, number and frequency of each
+    # population as numeric columns, labeled as (measure, population name)
+    def get_population_frequency_matrix(self):
+        return self._get_view('population')
 
-            else:  # there's only exome data
-                for i in range(len(exome_variant['populations'])):
-                    ac = exome_variant['populations'][i]['ac']
-                    an = exome_variant['populations'][i]['an']
-                    pop_id = exome_variant['populations'][i]['id']
-                    pop_allele_freq = ac/an if an else 0
-                    populations_freq_column[pop_id.upper()].append("{:e}".format(pop_allele_freq))
 
-        return populations_freq_column
+    def _process_populations_frequency(self):
+        # Only the populations actually recorded for these variants get
+        # columns, in the order of POPULATION_ID_MAP
+        recorded = {pop_id.lower(): i for i, pop_id in enumerate(self.columns.population_ids)}
+        pop_ids = [pop_id for pop_id in POPULATION_ID_MAP if pop_id.lower() in recorded]
+        positions = [recorded[pop_id.lower()] for pop_id in pop_ids]
+        names = [POPULATION_ID_MAP[pop_id] for pop_id in pop_ids]
+
+        allele_count = sum(self.columns.population_matrix(sequencing_type, 'ac')[:, positions]
+                           for sequencing_type in SEQUENCING_TYPES)
+        allele_number = sum(self.columns.population_matrix(sequencing_type, 'an')[:, positions]
+                            for sequencing_type in SEQUENCING_TYPES)
+        allele_freq = np.divide(allele_count, allele_number,
+                                out=np.zeros_like(allele_count), where=allele_number > 0)
+
+        columns = pd.MultiIndex.from_product([['Allele Count', 'Allele Number', 'Allele Frequency'], names])
+        matrix = np.hstack([allele_count, allele_number, allele_freq])
+        return pd.DataFrame(matrix, index=pd.RangeIndex(self.columns.n_variants), columns=columns)
+
+
+    # Returns a long-format (tidy) dataframe with a row for each population and
+    # subpopulation recorded for each variant, exome and genome data summed
+    # up, with the columns variant_id, population, subpopulation, sex, ac, an,
+    # af, ac_hom and ac_hemi. Sex-only rows (e.g. 'XX') have 'Total' as their
+    # population; subpopulation and sex are null when not applicable. The
+    # populations should have been requested, i.e. standard=False or
+    # additional_population_info=True
+    def get_population_table(self):
+        return self._get_view('population_table')
+
+
+    def _process_population_table(self):
+        rows, codes, sums = self._sum_populations()
+        labels = [self._split_population_id(pop_id) for pop_id in self.columns.population_ids]
+        population, subpopulation, sex = (np.array([label[i] for label in labels], dtype=object) for i in range(3))
+        variant_ids = self.columns.variant_ids
+
+        allele_freq = np.divide(sums['ac'], sums['an'], out=np.zeros(len(rows)), where=sums['an'] > 0)
+        return pd.DataFrame({
+            'variant_id': variant_ids[rows],
+            'population': population[codes],
+            'subpopulation': subpopulation[codes],
+            'sex': sex[codes],
+            'ac': sums['ac'],
+            'an': sums['an'],
+            'af': allele_freq,
+            'ac_hom': sums['ac_hom'],
+            'ac_hemi': sums['ac_hemi']
+        })
+
+
+    # Returns the variant row and population code of each (variant, population)
+    # pair recorded, sorted by variant, along with their ac, an, ac_hom and
+    # ac_hemi, summing up the exome and genome entries of the same pair
+    # through their position in a (variants x populations) grid
+    def _sum_populations(self):
+        populations = [self.columns.populations[sequencing_type] for sequencing_type in SEQUENCING_TYPES]
+        n_populations = max(len(self.columns.population_ids), 1)
+
+        cells = np.concatenate([pops['row'] * n_populations + pops['population'] for pops in populations])
+        cells, entries = np.unique(cells, return_inverse=True)
+        sums = {field: np.bincount(entries, minlength=len(cells),
+                                   weights=np.concatenate([pops[field] for pops in populations])).astype(np.int64)
+                for field in ('ac', 'an', 'ac_hom', 'ac_hemi')}
+        rows, codes = np.divmod(cells, n_populations)
+        return rows, codes, sums
+
+
+    # Variant pages (the 'variant' data of variant searches, as returned by
+    # VariantBatchSearch) stacked in a single dataframe, indexed by
+    # (variant_id, population). Each variant has the rows of the standard
+    # dataframe of a variant search, with the exome and genome data summed up
+    # (0 when missing from either). The hemizygotes are kept if any variant
+    # is in a sex chromosome
+    def get_variants_population_df(self):
+        return self._get_view('variants_population')
+
+
+    def _process_variants_population_df(self):
+        rows, codes, sums = self._sum_populations()
+        names = np.array([self._population_name(pop_id) for pop_id in self.columns.population_ids], dtype=object)
+        labels = names[codes]
+
+        # Each variant also gets a 'Total' row, summing its sex totals
+        is_sex_total = np.isin(labels, ['Total XX', 'Total XY'])
+        total_rows = np.unique(rows[is_sex_total])
+        for field, values in sums.items():
+            totals = np.bincount(rows[is_sex_total], weights=values[is_sex_total], minlength=self.columns.n_variants)
+            sums[field] = np.concatenate([values, totals[total_rows].astype(np.int64)])
+        rows = np.concatenate([rows, total_rows])
+        labels = np.concatenate([labels, np.full(len(total_rows), 'Total', dtype=object)])
+
+        order = np.argsort(rows, kind='stable')
+        variant_ids = self.columns.variant_ids
+        index = pd.MultiIndex.from_arrays([variant_ids[rows[order]], labels[order]], names=['variant_id', 'population'])
+        df = pd.DataFrame({
+            'Allele Count': sums['ac'][order],
+            'Allele Number': sums['an'][order],
+            'Number of Hemizygotes': sums['ac_hemi'][order],
+            'Number of Homozygotes': sums['ac_hom'][order]
+        }, index=index)
+        df['Allele Frequency'] = np.divide(df['Allele Count'].to_numpy(dtype=np.float64), df['Allele Number'],
+                                           out=np.zeros(len(df)), where=df['Allele Number'] > 0)
+
+        if not self.columns.fields['chrom'].isin(['X', 'Y']).any():
+            del df['Number of Hemizygotes']
+        return df
 
 
+    # Returns the row name of a population ID in variant search dataframes,
+    # named piece by piece (e.g. 'afr_XX' -> 'African XX'), and 'Total XX'
+    # or 'Total XY' for the sex-only IDs
+    @staticmethod
+    def _population_name(pop_id):
+        if str(pop_id).upper() in SEX_IDS:
+            return 'Total ' + POPULATION_NAMES[str(pop_id).upper()]
+        return ' '.join(POPULATION_NAMES.get(piece.upper(), piece) for piece in str(pop_id).split('_'))
+
+
+    # Returns the (population, subpopulation, sex) names of a population ID,
+    # e.g. 'afr_XX' -> ('African', None, 'XX'), 'nfe_swe' ->
+    # ('European (non-Finnish)', 'Swedish', None) and 'XY' -> ('Total', None,
+    # 'XY'). Unknown pieces are kept as they are, as subpopulations
+    @staticmethod
+    def _split_population_id(pop_id):
+        population, subpopulations, sex = None, [], None
+        for piece in str(pop_id).split('_'):
+            key = piece.upper()
+            if key in SEX_IDS:
+                sex = POPULATION_NAMES[key]
+            elif population is None and key in POPULATION_ID_MAP:
+                population = POPULATION_ID_MAP[key]
+            else:
+                subpopulations.append(POPULATION_NAMES.get(key, piece))
+        return population or 'Total', ' '.join(subpopulations) or None, sex
+
+
+    # Returns a new dataframe with the frequency columns appended; the columns
+    # of df (and the nested exome/genome data of raw dataframes) are not copied
     def _add_populations_freq_column(self, populations_freq_column, df):
-        df_copy = deepcopy(df)
-        for pop_id, pop_freqs in populations_freq_column.items():
-            if pop_freqs:   # If there is actually recorded frequencies for that population
-                df_copy[POPULATION_ID_MAP[pop_id]] = pop_freqs
-        return df_copy
+        return pd.concat([df, populations_freq_column.set_axis(df.index, axis=0)], axis=1)
 
 
     def _process_raw_df(self):
@@ -150,105 +341,56 @@ class DataManager:
 
         
 
-        df_renamed = self.raw_df.rename(columns=renamed_cols)
-        df_final = self._explicit_allele_informations(df_renamed, standard_cols)
-        self.standard_df = df_final.loc[:, standard_cols]
-        self._add_variant_columns()
-        return
+        # The standard dataframe is built straight from the parsed columns,
+        # without going through the nested data of the raw dataframe
+        df = pd.DataFrame({new_name: self.columns.fields[name] for name, new_name in renamed_cols.items()},
+                          index=pd.RangeIndex(self.columns.n_variants))
+        df_final = self._explicit_allele_informations(df, standard_cols)
+        standard_df = df_final.loc[:, standard_cols]
+        self._add_variant_columns(standard_df)
+        return standard_df
         
     
 
     def _explicit_allele_informations(self, df, standard_cols):
         chromosome = df['Variant ID'][0][0]
-        allele_count = []
-        allele_number = []
-        allele_freq = []
-        num_homozygotes = []
-        num_hemizygotes = []
-        region = []
-
-        for row in df.loc[:, ['genome','exome']].iterrows():
-            
-            genome_variant = row[1]['genome']
-            exome_variant = row[1]['exome']
-            n_homs = 0
-            n_hemi = 0
-            
-            if genome_variant:
-                n_homs, n_hemi = self._count_homos_hemis_variant_pops(n_homs, n_hemi, genome_variant)
-                
-                if exome_variant:   #there's genome and exome
-                    n_homs, n_hemi = self._count_homos_hemis_variant_pops(n_homs, n_hemi, exome_variant)
-                    variant_ac = genome_variant['ac']+exome_variant['ac']
-                    variant_an = genome_variant['an']+exome_variant['an']
-                    variant_af = genome_variant['af']+exome_variant['af']
-                    region.append("Genome and Exome")
-                    
-                else:   #there's only genome
-                    variant_ac = genome_variant['ac']
-                    variant_an = genome_variant['an']
-                    variant_af = genome_variant['af']
-                    region.append("Genome")
-                    
-            else:   #there's only exome
-                n_homs, n_hemi = self._count_homos_hemis_variant_pops(n_homs, n_hemi, exome_variant)
-                variant_ac = exome_variant['ac']
-                variant_an = exome_variant['an']
-                variant_af = exome_variant['af']
-                region.append("Exome")
-        
-            num_homozygotes.append(n_homs)
-            num_hemizygotes.append(n_hemi)
-            allele_count.append(variant_ac)
-            allele_number.append(variant_an)
-            allele_freq.append(variant_af)
-
-
-        df['Allele Count'] = allele_count
-        df['Allele Number'] = allele_number
-        df['Allele Frequency'] = allele_freq
-        df['Number of Homozygotes'] = num_homozygotes
+        genome = self._sequencing_arrays('genome')
+        exome = self._sequencing_arrays('exome')
+
+        # Variants with both genome and exome data sum them up; otherwise, the
+        # missing one holds zeros and the sum is just the existing data
+        df['Allele Count'] = genome['ac'] + exome['ac']
+        df['Allele Number'] = genome['an'] + exome['an']
+        df['Allele Frequency'] = genome['af'] + exome['af']
+        df['Number of Homozygotes'] = genome['ac_hom'] + exome['ac_hom']
         if (chromosome == 'X') or (chromosome == 'Y'):
-            df['Number of Hemizygotes'] = num_hemizygotes
+            df['Number of Hemizygotes'] = genome['ac_hemi'] + exome['ac_hemi']
             standard_cols.append('Number of Hemizygotes')
-        df['Source'] = region
+
+        source = np.where(genome['present'], np.where(exome['present'], "Genome and Exome", "Genome"), "Exome")
+        df['Source'] = source.astype(object)
 
         #if self.gnomad_version == 'gnomad_r2_1':
         standard_cols.append('Source')
         return df
 
-    
-    def _count_homos_hemis_variant_pops(self, n_homs, n_hemi, variant):
-        for population in variant['populations']:
-            n_homs += population['ac_hom']
-            n_hemi += population['ac_hemi']
-        return n_homs, n_hemi
-
-
-    def _add_variant_columns(self):
-
-        chromosome_col = []
-        location_col = []
-        gen_reference_col = []
-        gen_alternative_col = []
-
-        for variant in self.standard_df['Variant ID']:
-            info_pieces = variant.split('-')
-            chromosome_col.append(info_pieces[0])
-            location_col.append(info_pieces[1])
-            gen_reference_col.append(info_pieces[2])
-            gen_alternative_col.append(info_pieces[3])
-
-        self.standard_df['Chromosome'] = chromosome_col
-        self.standard_df['Location'] = location_col
-        self.standard_df['Reference'] = gen_reference_col
-        self.standard_df['Alternative'] = gen_alternative_col
-        return
-    
 
-    def __process_variant_search_data(self):
-        self.__build_variant_search_standard_df()
-        self.__extract_variant_metadata()
+    # Returns the variants' ac, an and af of a sequencing type, and their
+    # homozygote and hemizygote counts summed over the populations, as arrays
+    # holding 0 for missing data
+    def _sequencing_arrays(self, sequencing_type):
+        arrays = dict(self.columns.sequencing[sequencing_type])
+        for field in ('ac_hom', 'ac_hemi'):
+            arrays[field] = self.columns.population_totals(sequencing_type, field)
+        return arrays
+
+
+    def _add_variant_columns(self, df):
+        chromosomes, locations, references, alternatives = split_variant_ids(df['Variant ID'])
+        df['Chromosome'] = chromosomes
+        df['Location'] = locations
+        df['Reference'] = references
+        df['Alternative'] = alternatives
         return
     
 
@@ -263,36 +405,7 @@ class DataManager:
         else:   # only exome
             reqdf = pd.json_normalize(self.json_data['data']['variant']['exome']['populations']).set_index('id')
 
-        new_index = {}
-        frequencies = []
-        for row in reqdf.iterrows():
-            row_id = row[0]
-            new_row_name = ""
-            
-            for piece in row_id.split('_'):
-
-                piece = piece.upper()
-                try:
-                    new_row_name += POPULATION_ID_MAP[piece] + " "
-                except:
-                    try:
-                        new_row_name += SUBPOPULATION_ID_MAP[piece] + " "
-                    except:
-                        new_row_name += piece
-
-            new_row_name = new_row_name[0:-1]
-            new_index[row_id] = new_row_name
-            
-            frequency = 0
-            if row[1]['an']:
-                frequency = row[1]['ac']/row[1]['an']
-            frequencies.append(frequency)
-            
-
-        new_index['XX'] = 'Total XX'
-        new_index['XY'] = 'Total XY'
-        new_index['FEMALE'] = 'Total XX'
-        new_index['MALE'] = 'Total XY'
+        new_index = {row_id: self._population_name(row_id) for row_id in reqdf.index}
         new_columns = {'ac': 'Allele Count', 'an': 'Allele Number',
                     'ac_hemi': 'Number of Hemizygotes', 'ac_hom': 'Number of Homozygotes'}
 
@@ -300,26 +413,29 @@ class DataManager:
         
         total_row = df.loc['Total XX'] + df.loc['Total XY']
         total_row.name = 'Total'
-        df = df.append([total_row])
+        df = pd.concat([df, total_row.to_frame().T])
 
- 
-        frequencies.append(df.loc['Total']['Allele Count'] / df.loc['Total']['Allele Number'])
-        df['Allele Frequency'] = frequencies
-        df['Allele Frequency'] = df['Allele Frequency'].fillna(0)
+        # Populations with no allele number (e.g. missing from either the
+        # exome or the genome data) get a frequency of 0
+        allele_number = df['Allele Number'].to_numpy(dtype=np.float64)
+        df['Allele Frequency'] = np.divide(df['Allele Count'].to_numpy(dtype=np.float64), allele_number,
+                                           out=np.zeros(len(df)), where=allele_number > 0)
         
         chromosome = self.json_data['data']['variant']['chrom']
         if chromosome != 'X' and chromosome != 'Y':
             del df['Number of Hemizygotes']
 
-        self.standard_df = df
-        return
+        return df
 
 
+    # The metadata is a new dictionary without the exome and genome
+    # populations, but it shares the remaining nested data with json_data
     def __extract_variant_metadata(self):
-        metadata = deepcopy(self.json_data)
-        if metadata['data']['variant']['genome']:
-            metadata['data']['variant']['genome'].pop('populations')
-        if metadata['data']['variant']['exome']:
-            metadata['data']['variant']['exome'].pop('populations')
-        self.variant_metadata = metadata['data']['variant']
-        return
+        if not self.variant_search:
+            return None
+        metadata = dict(self.json_data['data']['variant'])
+        for sequencing_type in ('genome', 'exome'):
+            if metadata[sequencing_type]:
+                metadata[sequencing_type] = {key: value for key, value in metadata[sequencing_type].items()
+                                             if key != 'populations'}
+        return metadata
@@ -0,0 +1,54 @@
+"""This module contains the GeneIdMap class, a memo of the Ensembl IDs of the searched gene symbols."""
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+
+class GeneIdMap:
+
+    def __init__(self, path: Optional[str] = None):
+        """Constructor for the GeneIdMap class.
+
+        The Ensembl IDs are kept per reference genome, as the same symbol may map to different IDs in GRCh37 and
+        GRCh38. The gene symbols are case insensitive.
+
+        Args:
+            path: The path of a JSON file where the map is persisted, so that it is shared by later sessions. It is
+                loaded if it exists, and rewritten whenever new IDs are added. Defaults to None (kept in memory only).
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._ids: Dict[str, str] = {}
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if path and os.path.exists(path):
+            with open(path) as file:
+                self._ids = json.load(file)
+
+
+    @staticmethod
+    def _key(reference_genome: str, symbol: str) -> str:
+        return f"{reference_genome}:{symbol.upper()}"
+
+
+    def get(self, reference_genome: str, symbol: str) -> Optional[str]:
+        """Get the Ensembl ID of a gene symbol, or None if it was not resolved yet."""
+        return self._ids.get(self._key(reference_genome, symbol))
+
+
+    def update(self, reference_genome: str, ensembl_ids: Dict[str, str]):
+        """Add the Ensembl IDs (by gene symbol) resolved for a reference genome, persisting them if there is a path."""
+        with self._lock:
+            self._ids.update({self._key(reference_genome, symbol): ensembl_id
+                              for symbol, ensembl_id in ensembl_ids.items()})
+            if self.path:
+                temporary_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(temporary_path, 'w') as file:
+                    json.dump(self._ids, file)
+                os.replace(temporary_path, self.path)
+        return
+
+
+    def __len__(self) -> int:
+        return len(self._ids)
@@ -0,0 +1,258 @@
+"""This module contains the GeneIndex class, a local index of gene and transcript coordinates."""
+import json
+import os
+import threading
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from pynoma.BatchSearch import alias_query, alias_variables
+from pynoma.Logger import Logger
+from pynoma.Search import Search, GeneSearch, RegionSearch
+
+
+class GeneIndex:
+
+    def __init__(self, path: Optional[str] = None):
+        """Constructor for the GeneIndex class.
+
+        Keeps, per reference genome, the coordinates of genes and transcripts: the chromosome, start, stop, strand and
+        exons (as gnomAD reports them, with their feature type: 'CDS', 'UTR' or 'exon'). Genes are looked up by symbol
+        (case insensitive) or Ensembl ID, transcripts by Ensembl ID, and genes by position, all without contacting
+        gnomAD. Entries are added in bulk with `build` (by gene) and `build_region` (every gene in a region).
+
+        Args:
+            path: The path of a JSON file where the index is persisted, so that it is shared by later sessions. It is
+                loaded if it exists, and rewritten whenever entries are added. Defaults to None (kept in memory only).
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Dict[str, Any]]] = {}   # {reference genome: {genes, transcripts, symbols}}
+        self._by_position: Dict[Tuple[str, str], Tuple[List[int], List[Dict[str, Any]]]] = {}   # sorted gene starts
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if path and os.path.exists(path):
+            with open(path) as file:
+                self._entries = json.load(file)
+
+
+    def get_gene(self, dataset_version: Union[int, str], gene: str) -> Optional[Dict[str, Any]]:
+        """Get the indexed gene with the given symbol or Ensembl ID, or None if it is not indexed."""
+        entries = self._get_entries(dataset_version)
+        gene_id = gene if gene in entries['genes'] else entries['symbols'].get(gene.upper())
+        return entries['genes'].get(gene_id)
+
+
+    def get_transcript(self, dataset_version: Union[int, str], transcript: str) -> Optional[Dict[str, Any]]:
+        """Get the indexed transcript with the given Ensembl ID (with or without version), or None if not indexed."""
+        return self._get_entries(dataset_version)['transcripts'].get(transcript.split('.')[0])
+
+
+    def genes_in_region(self,
+                        dataset_version: Union[int, str],
+                        chromosome: Union[int, str],
+                        start: int,
+                        end: int
+                        ) -> List[Dict[str, Any]]:
+        """Get the indexed genes overlapping a region, sorted by start."""
+        _, reference_genome = Search.get_dataset_id(dataset_version)
+        key = (reference_genome, str(chromosome))
+        with self._lock:
+            if key not in self._by_position:
+                genes = sorted((gene for gene in self._get_entries(dataset_version)['genes'].values()
+                                if gene['chrom'] == str(chromosome)), key=lambda gene: gene['start'])
+                self._by_position[key] = ([gene['start'] for gene in genes], genes)
+            starts, genes = self._by_position[key]
+        return [gene for gene in genes[:bisect_right(starts, end)] if gene['stop'] >= start]
+
+
+    def exon_regions(self,
+                     dataset_version: Union[int, str],
+                     feature: str,
+                     padding: int = 0,
+                     feature_types: Optional[Iterable[str]] = None
+                     ) -> List[Tuple[int, int]]:
+        """Get the (start, end) regions covered by the exons of a gene or transcript, padded and merged.
+
+        Args:
+            dataset_version: The version of the gnomAD dataset to be used. It can be either 2, 3 or hg19/h38.
+            feature: The gene symbol, gene Ensembl ID or transcript Ensembl ID.
+            padding: The number of bases added to both sides of each exon. Defaults to 0.
+            feature_types: The exon feature types kept (e.g. ('CDS',)). Defaults to None (all of them).
+
+        Raises:
+            Exception: If the gene or transcript is not indexed.
+
+        Returns:
+            The regions, sorted by position, with overlapping or adjacent ones merged.
+        """
+        entry = self._get_feature(dataset_version, feature)
+        exons = [exon for exon in entry['exons'] if feature_types is None or exon['feature_type'] in feature_types]
+        regions: List[Tuple[int, int]] = []
+        for exon in sorted(exons, key=lambda exon: exon['start']):
+            start, end = exon['start'] - padding, exon['stop'] + padding
+            if regions and start <= regions[-1][1] + 1:
+                regions[-1] = (regions[-1][0], max(regions[-1][1], end))
+            else:
+                regions.append((start, end))
+        return regions
+
+
+    def region_searches(self,
+                        dataset_version: Union[int, str],
+                        feature: str,
+                        padding: int = 0,
+                        exons: bool = False,
+                        feature_types: Optional[Iterable[str]] = None
+                        ) -> List[RegionSearch]:
+        """Build the region searches covering a gene or transcript, from its indexed coordinates.
+
+        Unlike gene and transcript searches, which return the variants gnomAD annotates with the gene or transcript,
+        region searches return every variant in the region.
+
+        Args:
+            dataset_version: The version of the gnomAD dataset to be used. It can be either 2, 3 or hg19/h38.
+            feature: The gene symbol, gene Ensembl ID or transcript Ensembl ID.
+            padding: The number of bases added to both sides of the region (or of each exon). Defaults to 0.
+            exons: If True, there is a search per exon region (see `exon_regions`) instead of a single search from the
+                start to the stop of the gene or transcript. Defaults to False.
+            feature_types: The exon feature types kept when `exons` is True. Defaults to None (all of them).
+
+        Raises:
+            Exception: If the gene or transcript is not indexed.
+
+        Returns:
+            The RegionSearch objects, sorted by position.
+        """
+        entry = self._get_feature(dataset_version, feature)
+        if exons:
+            regions = self.exon_regions(dataset_version, feature, padding, feature_types)
+        else:
+            regions = [(entry['start'] - padding, entry['stop'] + padding)]
+        return [RegionSearch(dataset_version, entry['chrom'], max(start, 1), end) for start, end in regions]
+
+
+    def build(self,
+              genes: Iterable[str],
+              dataset_version: Union[int, str] = 3,
+              batch_size: int = 50
+              ) -> Dict[str, Optional[str]]:
+        """Add the coordinates of many genes, and of their transcripts, with aliased `gene_coordinates` queries.
+
+        Genes already indexed with their transcripts are not requested again (those added by `build_region` only are).
+        The resolved Ensembl IDs are also stored in the map shared by all gene searches (`GeneSearch.gene_ids`), so
+        that their GeneSearch objects skip the lookup request.
+
+        Args:
+            genes: The gene symbols and/or Ensembl IDs to be indexed.
+            dataset_version: The version of the gnomAD dataset to be used. It can be either 2, 3 or hg19/h38.
+            batch_size: The maximum number of genes requested at once. Defaults to 50.
+
+        Returns:
+            A dictionary with the Ensembl ID of each gene given, or None for the genes not found.
+        """
+        from pynoma.Queries import gene_coordinates
+
+        _, reference_genome = Search.get_dataset_id(dataset_version)
+        genes = list(dict.fromkeys(genes))
+        missing = [gene for gene in genes if 'transcripts' not in (self.get_gene(dataset_version, gene) or {})]
+
+        for start in range(0, len(missing), batch_size):
+            chunk = missing[start:start+batch_size]
+            query, _ = alias_query(gene_coordinates, len(chunk))
+            variables = alias_variables([{'geneId' if gene.upper().startswith('ENSG') else 'geneSymbol': gene,
+                                          'referenceGenome': reference_genome} for gene in chunk])
+            json_data = Search(dataset_version, query, "%s").request_gnomad((json.dumps(variables),))
+
+            # Genes not found come as null aliases, along with an error each
+            if not json_data.get('data') and json_data.get('errors'):
+                raise Exception(f"Batch request to gnomAD failed: {json_data.get('errors')}.")
+            found = []
+            for i, gene in enumerate(chunk):
+                entry = (json_data.get('data') or {}).get(f"q{i}")
+                if entry:
+                    found.append(entry)
+                else:
+                    Logger.no_gene_found_with_given_name(gene)
+            self._add(reference_genome, found)
+            GeneSearch.gene_ids.update(reference_genome, {entry['symbol']: entry['gene_id'] for entry in found})
+
+        ids = {gene: self.get_gene(dataset_version, gene) for gene in genes}
+        return {gene: entry['gene_id'] if entry else None for gene, entry in ids.items()}
+
+
+    def build_region(self,
+                     dataset_version: Union[int, str],
+                     chromosome: Union[int, str],
+                     start: int,
+                     end: int
+                     ) -> List[str]:
+        """Add the coordinates of every gene overlapping a region, with a single `fetch_region` query.
+
+        Genes are added without their transcripts (which `build` adds), keeping those of genes already indexed.
+
+        Returns:
+            The Ensembl IDs of the genes in the region.
+        """
+        from pynoma.Queries import fetch_region
+
+        _, reference_genome = Search.get_dataset_id(dataset_version)
+        variables = json.dumps({'chrom': str(chromosome), 'start': int(start), 'stop': int(end),
+                                'referenceGenome': reference_genome})
+        json_data = Search(dataset_version, fetch_region, "%s").request_gnomad((variables,))
+        if not (json_data.get('data') or {}).get('region'):
+            raise Exception(f"Request to gnomAD failed: {json_data.get('errors')}.")
+
+        genes = [{**gene, 'chrom': str(chromosome)} for gene in json_data['data']['region']['genes'] or []]
+        self._add(reference_genome, genes)
+        return [gene['gene_id'] for gene in genes]
+
+
+    def _get_entries(self, dataset_version: Union[int, str]) -> Dict[str, Dict[str, Any]]:
+        _, reference_genome = Search.get_dataset_id(dataset_version)
+        return self._entries.get(reference_genome) or {'genes': {}, 'transcripts': {}, 'symbols': {}}
+
+
+    def _get_feature(self, dataset_version: Union[int, str], feature: str) -> Dict[str, Any]:
+        entry = self.get_gene(dataset_version, feature) or self.get_transcript(dataset_version, feature)
+        if entry is None:
+            raise Exception(f"{feature} is not in the gene index. Add it with GeneIndex.build first.")
+        return entry
+
+
+    def _add(self, reference_genome: str, genes: List[Dict[str, Any]]):
+        """Add gnomAD gene entries (and their transcripts, if any), persisting the index if there is a path."""
+        with self._lock:
+            entries = self._entries.setdefault(reference_genome, {'genes': {}, 'transcripts': {}, 'symbols': {}})
+            for gene in genes:
+                transcripts = gene.get('transcripts')
+                entry = {key: value for key, value in gene.items() if key != 'transcripts'}
+                entry['chrom'] = str(entry['chrom'])
+                if transcripts is not None:
+                    entry['transcripts'] = [transcript['transcript_id'] for transcript in transcripts]
+                for transcript in transcripts or []:
+                    # Transcripts span from their first to their last exon
+                    entries['transcripts'][transcript['transcript_id']] = {
+                        'transcript_id': transcript['transcript_id'],
+                        'gene_id': gene['gene_id'],
+                        'chrom': entry['chrom'],
+                        'start': min((exon['start'] for exon in transcript['exons']), default=gene['start']),
+                        'stop': max((exon['stop'] for exon in transcript['exons']), default=gene['stop']),
+                        'strand': transcript.get('strand'),
+                        'exons': transcript['exons']
+                    }
+                # Region entries (without transcripts) never replace the values of entries added by `build`
+                indexed = entries['genes'].get(gene['gene_id'], {})
+                merged = {**entry, **indexed} if transcripts is None else {**indexed, **entry}
+                entries['genes'][gene['gene_id']] = merged
+                entries['symbols'][gene['symbol'].upper()] = gene['gene_id']
+                self._by_position.pop((reference_genome, entry['chrom']), None)
+
+            if self.path:
+                temporary_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(temporary_path, 'w') as file:
+                    json.dump(self._entries, file)
+                os.replace(temporary_path, self.path)
+        return
+
+
+    def __len__(self) -> int:
+        return sum(len(entries['genes']) for entries in self._entries.values())
@@ -37,12 +37,60 @@ class Logger:
         Logger.handler.info(log)
         return
 
+    @classmethod
+    def batch_search_failed(cls, i, error):
+        log = f"Batch search {i} failed: {error!r}."
+        Logger.handler.warning(log)
+        return
+
+    @classmethod
+    def batch_item_failed(cls, search, errors):
+        log = f"{search} failed in a batch request: {errors}."
+        Logger.handler.warning(log)
+        return
+
+    @classmethod
+    def region_span_failed(cls, chromosome, start, end, error):
+        log = f"Fetching the coalesced regions {chromosome}:{start}-{end} failed: {error!r}. Fetching them one by one."
+        Logger.handler.warning(log)
+        return
+
+    @classmethod
+    def annotation_region_failed(cls, chromosome, start, end, error):
+        log = f"Fetching the region {chromosome}:{start}-{end} failed: {error!r}. Its variants are not annotated."
+        Logger.handler.warning(log)
+        return
+
+    @classmethod
+    def annotation_variants_failed(cls, count, error):
+        log = f"Looking up {count} variants failed: {error!r}. They are not annotated."
+        Logger.handler.warning(log)
+        return
+
+    @classmethod
+    def annotated_rows(cls, rows, annotated):
+        log = f"Annotated rows: {rows} ({annotated} found in gnomAD)."
+        Logger.handler.info(log)
+        return
+
+    @classmethod
+    def dataframe_memory_usage(cls, before, after):
+        log = f"Dataframe memory usage: {before / 1024 ** 2:.1f} MB -> {after / 1024 ** 2:.1f} MB."
+        Logger.handler.info(log)
+        return
+
     @classmethod
     def request_failed(cls, response):
         log = f"Request failed: {response}."
         Logger.handler.info(log)
         return
     
+    @classmethod
+    def request_retry(cls, error, retry):
+        log = f"Request to gnomAD failed: {error!r}. Retrying in {retry:.1f} seconds..."
+        Logger.handler.warning(log)
+        return
+    
     @classmethod
     def too_many_requests_error(cls, retry):
         log = "gnomAD is complaining about too many requests. "
@@ -398,6 +398,32 @@ gene_search_variables = """{
   "referenceGenome": "GRCh38"
 }"""
 
+gene_coordinates = """query GeneCoordinates($geneId: String, $geneSymbol: String, $referenceGenome: ReferenceGenomeId!) {
+  gene(gene_id: $geneId, gene_symbol: $geneSymbol, reference_genome: $referenceGenome) {
+    gene_id
+    symbol
+    chrom
+    start
+    stop
+    strand
+    canonical_transcript_id
+    exons {
+      feature_type
+      start
+      stop
+    }
+    transcripts {
+      transcript_id
+      strand
+      exons {
+        feature_type
+        start
+        stop
+      }
+    }
+  }
+}"""
+
 variant_in_gene = """query VariantsInGene($geneId: String!, $datasetId: DatasetId!, $referenceGenome: ReferenceGenomeId!) {
   gene(gene_id: $geneId, reference_genome: $referenceGenome) {
     clinvar_variants {
@@ -654,6 +680,38 @@ variant_search = """query GnomadVariant($variantId: String, $rsid: String, $data
 }"""
 
 
+# Only the population data of a variant, used by VariantBatchSearch
+variant_populations_search = """query GnomadVariantPopulations($variantId: String, $rsid: String, $datasetId: DatasetId!) {
+  variant(variantId: $variantId, rsid: $rsid, dataset: $datasetId) {
+    variantId
+    chrom
+    rsid
+    exome {
+      ac
+      an
+      populations {
+        id
+        ac
+        an
+        ac_hemi
+        ac_hom
+      }
+    }
+    genome {
+      ac
+      an
+      populations {
+        id
+        ac
+        an
+        ac_hemi
+        ac_hom
+      }
+    }
+  }
+}"""
+
+
 variant_search_variables = """{
   "datasetId": "%s",
   "variantId": "%s"
@@ -723,4 +781,80 @@ variant_in_transcript_variables = """{
   "datasetId": "%s",
   "transcriptId": "%s",
   "referenceGenome": "GRCh38"
-}"""
\ No newline at end of file
+}"""
+
+
+# Field lists of the variants queries above, used to build projected queries holding only the fields an output needs
+variant_fields = ('consequence', 'flags', 'gene_id', 'gene_symbol', 'transcript_id', 'hgvs', 'hgvsc', 'hgvsp', 'lof',
+                  'lof_filter', 'lof_flags', 'pos', 'rsid', 'variant_id: variantId')
+frequency_fields = ('ac', 'ac_hemi', 'ac_hom', 'an', 'af', 'filters')
+population_fields = ('id', 'ac', 'an', 'ac_hemi', 'ac_hom')
+clinvar_fields = ('clinical_significance', 'clinvar_variation_id', 'gold_stars', 'major_consequence', 'pos',
+                  'variant_id')
+
+# Fields needed by the standard dataframe (DataManager.process_standard_dataframe). The population IDs keep the
+# population views of the DataManager (e.g. get_population_table) working on the standard output
+standard_variant_fields = ('consequence', 'flags', 'gene_symbol', 'hgvs', 'pos', 'rsid', 'variant_id: variantId')
+standard_frequency_fields = ('ac', 'an', 'af')
+standard_population_fields = ('id', 'ac_hemi', 'ac_hom')
+
+variants_query_headers = {
+    'region': """query VariantInRegion($chrom: String!, $start: Int!, $stop: Int!, $datasetId: DatasetId!, $referenceGenome: ReferenceGenomeId!) {
+  region(start: $start, stop: $stop, chrom: $chrom, reference_genome: $referenceGenome) {""",
+    'gene': """query VariantsInGene($geneId: String!, $datasetId: DatasetId!, $referenceGenome: ReferenceGenomeId!) {
+  gene(gene_id: $geneId, reference_genome: $referenceGenome) {""",
+    'transcript': """query VariantsInTranscript($transcriptId: String!, $datasetId: DatasetId!, $referenceGenome: ReferenceGenomeId!) {
+  transcript(transcript_id: $transcriptId, reference_genome: $referenceGenome) {"""
+}
+
+
+def build_variants_query(target,
+                         variant_fields=variant_fields,
+                         frequency_fields=frequency_fields,
+                         population_fields=population_fields,
+                         clinvar=True,
+                         lof_curation=False):
+    """Build a variants query (as in_region_v3, variant_in_gene or variant_in_transcript) requesting only some fields.
+
+    The query takes the same variables as the preset query of its target.
+
+    Args:
+        target: The top-level field of the query: 'region', 'gene' or 'transcript'.
+        variant_fields: The fields of each variant.
+        frequency_fields: The fields of each variant's exome and genome data. If empty, these blocks are not requested.
+        population_fields: The fields of each population of the exome and genome data. If empty, the populations are
+            not requested.
+        clinvar: If True, the ClinVar variants are requested as well.
+        lof_curation: If True, the loss-of-function curation of each variant is requested as well (gene queries).
+
+    Returns:
+        The query text.
+    """
+    sequencing_fields = list(frequency_fields)
+    if sequencing_fields and population_fields:
+        sequencing_fields.append(("populations", population_fields))
+
+    fields = list(variant_fields)
+    if sequencing_fields:
+        fields += [("exome", sequencing_fields), ("genome", sequencing_fields)]
+    if lof_curation:
+        fields.append(("lof_curation", ("verdict", "flags")))
+
+    sections = []
+    if clinvar:
+        sections.append(_selection("clinvar_variants", clinvar_fields, 4))
+    sections.append(_selection("variants(dataset: $datasetId)", fields, 4))
+    return variants_query_headers[target] + "\n" + "\n".join(sections) + "\n  }\n}"
+
+
+
+def _selection(name, fields, indent):
+    """Render a selection set, where each field is either a name or a (name, subfields) pair."""
+    lines = [f"{' ' * indent}{name} {{"]
+    for field in fields:
+        if isinstance(field, tuple):
+            lines.append(_selection(field[0], field[1], indent + 2))
+        else:
+            lines.append(f"{' ' * (indent + 2)}{field}")
+    lines.append(f"{' ' * indent}}}")
+    return "\n".join(lines)
@@ -0,0 +1,113 @@
+"""This module contains the RateLimiter class, a token bucket pacing the requests sent to gnomAD."""
+import os
+import threading
+from time import sleep, time
+from typing import Callable, Optional, Tuple
+
+
+class RateLimiter:
+
+    def __init__(self, rate: Optional[float] = 2.0, burst: int = 10, lock_file: Optional[str] = None):
+        """Constructor for the RateLimiter class.
+
+        Every request takes a token from the bucket, which is refilled at `rate` tokens per second up to `burst`
+        tokens. Requests are therefore sent right away while the bucket has tokens, and spaced by 1/rate seconds once
+        it is empty. The bucket is shared by all the threads (and coroutines) using the limiter; with a `lock_file`,
+        its state lives in that file and is also shared by every process pointing to it.
+
+        Args:
+            rate: The sustained number of requests per second. None disables the limiter. Defaults to 2.
+            burst: The maximum number of requests sent back to back after an idle period. Defaults to 10.
+            lock_file: The path of a file holding the bucket state, to share it across processes (POSIX only).
+                Defaults to None (the bucket is local to the process).
+        """
+        self.rate = rate
+        self.burst = burst
+        self.lock_file = lock_file
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._timestamp = time()
+        self._paused_until = 0.0
+
+
+    def acquire(self) -> float:
+        """Block until a request is allowed to be sent.
+
+        Returns:
+            The number of seconds spent waiting.
+        """
+        wait = self.reserve()
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+
+    def reserve(self) -> float:
+        """Take a token from the bucket, even if it is not available yet.
+
+        Returns:
+            The number of seconds the caller must wait before sending its request (0 if it can be sent right away).
+            Coroutines should `await asyncio.sleep` this value instead of blocking in `acquire`.
+        """
+        with self._lock:
+            paused = max(self._paused_until - time(), 0.0)
+        if not self.rate:
+            return paused
+
+        def take(tokens: float) -> float:
+            return tokens - 1
+        tokens = self._update(take)
+        return max(-tokens / self.rate if tokens < 0 else 0.0, paused)
+
+
+    def pause(self, seconds: float):
+        """Empty the bucket so that no request is sent by any user of the limiter in the next `seconds` seconds.
+
+        Used when gnomAD complains about too many requests, so that every thread backs off together. It never blocks:
+        the wait is taken by the next `acquire` (or awaited after the next `reserve`), even if the limiter is disabled.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time() + seconds)
+        if not self.rate:
+            return
+
+        def drain(tokens: float) -> float:
+            return min(tokens, 0) - seconds * self.rate
+        self._update(drain)
+        return
+
+
+    def _update(self, operation: Callable[[float], float]) -> float:
+        with self._lock:
+            if self.lock_file:
+                return self._update_shared_state(operation)
+            self._tokens, self._timestamp = self._refill(self._tokens, self._timestamp, operation)
+            return self._tokens
+
+
+    def _refill(self, tokens: float, timestamp: float, operation: Callable[[float], float]) -> Tuple[float, float]:
+        now = time()
+        tokens = min(float(self.burst), tokens + (now - timestamp) * self.rate)
+        return operation(tokens), now
+
+
+    def _update_shared_state(self, operation: Callable[[float], float]) -> float:
+        import fcntl
+
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            state = os.read(fd, 64).decode().split()
+            if len(state) == 2:
+                tokens, timestamp = float(state[0]), float(state[1])
+            else:
+                tokens, timestamp = float(self.burst), time()
+
+            tokens, timestamp = self._refill(tokens, timestamp, operation)
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, f"{tokens!r} {timestamp!r}".encode())
+            return tokens
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
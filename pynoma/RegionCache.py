@@ -0,0 +1,163 @@
+"""This module contains the RegionCache class, an in-memory cache of region search results indexed by position."""
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+class _CachedRegions:
+    """The covered intervals and the items (variants and ClinVar variants) fetched for a single cache key."""
+
+    def __init__(self):
+        self.intervals: List[Tuple[int, int]] = []   # sorted, disjoint and non-adjacent
+        self.items: Dict[str, Dict[str, Dict[str, Any]]] = {}   # {region key: {variant_id: item}}
+        self._index: Dict[str, Tuple[List[int], List[Dict[str, Any]]]] = {}   # sorted positions and items, by key
+
+    def add(self, intervals: List[Tuple[int, int]], region: Dict[str, Any]):
+        for key, items in region.items():
+            stored = self.items.setdefault(key, {})
+            for item in items or []:
+                stored.setdefault(item['variant_id'], item)
+            self._index.pop(key, None)
+
+        merged: List[Tuple[int, int]] = []
+        for start, end in sorted(self.intervals + list(intervals)):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        self.intervals = merged
+
+    def missing(self, start: int, end: int) -> List[Tuple[int, int]]:
+        gaps = []
+        for interval_start, interval_end in self.intervals:
+            if interval_end < start:
+                continue
+            if interval_start > end:
+                break
+            if interval_start > start:
+                gaps.append((start, interval_start - 1))
+            start = max(start, interval_end + 1)
+        if start <= end:
+            gaps.append((start, end))
+        return gaps
+
+    def slice(self, start: int, end: int) -> Dict[str, List[Dict[str, Any]]]:
+        region = {}
+        for key, stored in self.items.items():
+            if key not in self._index:
+                items = sorted(stored.values(), key=lambda item: item['pos'])
+                self._index[key] = ([item['pos'] for item in items], items)
+            positions, items = self._index[key]
+            region[key] = items[bisect_left(positions, start):bisect_right(positions, end)]
+        return region
+
+    def __len__(self) -> int:
+        return len(self.items.get('variants', {}))
+
+
+
+class RegionCache:
+
+    def __init__(self, max_variants: Optional[int] = 5000000):
+        """Constructor for the RegionCache class.
+
+        Keeps the variants (and ClinVar variants) fetched by region searches along with the intervals already
+        requested, per dataset, chromosome and query (so that results with different fields are never mixed). A region
+        fully covered by earlier searches is answered by slicing the cached variants by position, and a partially
+        covered one only needs its missing gaps to be fetched.
+
+        Args:
+            max_variants: The maximum number of variants kept. Beyond it, the least recently used chromosomes (along
+                with their dataset and query) are evicted. If None, there is no limit. Defaults to 5000000.
+        """
+        self.max_variants = max_variants
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, _CachedRegions]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def missing(self, key: Hashable, start: int, end: int) -> List[Tuple[int, int]]:
+        """Get the (start, end) gaps of a region not covered by the cache yet, in order."""
+        with self._lock:
+            entry = self._entries.get(key)
+            gaps = entry.missing(start, end) if entry else [(start, end)]
+            if gaps:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return gaps
+
+
+    def add(self,
+            key: Hashable,
+            intervals: List[Tuple[int, int]],
+            region: Dict[str, Any],
+            start: Optional[int] = None,
+            end: Optional[int] = None
+            ) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """Store the region data (e.g. variants and clinvar_variants lists) fetched for the given intervals.
+
+        Args:
+            key: The cache key of the region data.
+            intervals: The (start, end) intervals the data was fetched for.
+            region: The region data of the gnomAD response.
+            start: If given (along with end), the start of the region data returned.
+            end: The end of the region data returned.
+
+        Returns:
+            If start and end are given, the cached region data between them (see `get`), taken along with the update so
+            that no other thread evicts it in between. Otherwise, None.
+        """
+        with self._lock:
+            entry = self._entries.setdefault(key, _CachedRegions())
+            entry.add(intervals, region)
+            self._entries.move_to_end(key)
+            data = self._slice(entry, start, end) if start is not None else None
+            self._evict()
+            return data
+
+
+    def get(self, key: Hashable, start: int, end: int) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """Get the cached region data with positions between start and end, sorted by position.
+
+        Returns None if the region is not fully covered, e.g. because its data was evicted after `missing` was called.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return self._slice(entry, start, end)
+
+
+    def clear(self):
+        """Remove every cached region."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+        return
+
+
+    def stats(self) -> Dict[str, int]:
+        """Get the number of fully covered (hits) and not fully covered (misses) lookups, and the number of variants."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'variants': sum(len(entry) for entry in self._entries.values())}
+
+
+    def _evict(self):
+        if self.max_variants is None:
+            return
+        total = sum(len(entry) for entry in self._entries.values())
+        while total > self.max_variants and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            total -= len(entry)
+        return
+
+
+    @staticmethod
+    def _slice(entry: _CachedRegions, start: int, end: int) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        return None if entry.missing(start, end) else entry.slice(start, end)
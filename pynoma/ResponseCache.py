@@ -0,0 +1,153 @@
+"""This module contains the ResponseCache class, a persistent cache of gnomAD responses."""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from time import time
+from typing import Any, Dict, Optional
+
+
+class ResponseCache:
+
+    def __init__(self,
+                 path: str = os.path.join(os.path.expanduser("~"), ".cache", "pynoma", "responses.sqlite"),
+                 ttl: Optional[float] = 7 * 24 * 3600,
+                 max_size: Optional[int] = 1024 ** 3):
+        """Constructor for the ResponseCache class.
+
+        The responses are stored compressed in a SQLite database, which can be safely shared by several threads and
+        processes. Expired entries are dropped when read, and the least recently used entries are evicted whenever the
+        stored responses exceed `max_size` bytes.
+
+        Args:
+            path: The path of the SQLite database file. Defaults to ~/.cache/pynoma/responses.sqlite.
+            ttl: The default number of seconds a response stays valid. None keeps responses forever. Defaults to 7
+                days.
+            max_size: The maximum total size, in bytes, of the stored (compressed) responses. None disables the
+                eviction. Defaults to 1 GiB.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                      key TEXT PRIMARY KEY,
+                                      value BLOB NOT NULL,
+                                      size INTEGER NOT NULL,
+                                      expires REAL,
+                                      last_access REAL NOT NULL
+                                  )""")
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+
+    @staticmethod
+    def make_key(end_point: str, query: str, variables: str, dataset_id: str) -> str:
+        """Build the cache key of a request.
+
+        Args:
+            end_point: The URL the request is sent to.
+            query: The GraphQL query.
+            variables: The rendered query variables, as JSON text. Formatting differences do not change the key.
+            dataset_id: The gnomAD dataset ID of the search.
+
+        Returns:
+            The hexadecimal SHA-256 digest identifying the request.
+        """
+        try:
+            variables = json.dumps(json.loads(variables), sort_keys=True)
+        except ValueError:
+            pass
+        content = json.dumps([end_point, query, variables, dataset_id])
+        return hashlib.sha256(content.encode()).hexdigest()
+
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a stored response.
+
+        Args:
+            key: The cache key of the request (see `make_key`).
+
+        Returns:
+            The response JSON, or None if it is not stored or has expired.
+        """
+        now = time()
+        with self._connection as connection:
+            row = connection.execute("SELECT value, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] is not None and row[1] <= now:
+                connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+
+        with self._counter_lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return json.loads(zlib.decompress(row[0])) if row is not None else None
+
+
+    def put(self, key: str, response: Dict[str, Any], ttl: Optional[float] = None):
+        """Store a response, evicting the least recently used ones if the cache grows past its maximum size.
+
+        Args:
+            key: The cache key of the request (see `make_key`).
+            response: The response JSON.
+            ttl: The number of seconds the response stays valid. Defaults to the cache's `ttl`.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        value = zlib.compress(json.dumps(response).encode())
+        now = time()
+        with self._connection as connection:
+            connection.execute("INSERT OR REPLACE INTO responses (key, value, size, expires, last_access) "
+                               "VALUES (?, ?, ?, ?, ?)",
+                               (key, value, len(value), now + ttl if ttl is not None else None, now))
+            if self.max_size is not None:
+                connection.execute("""DELETE FROM responses WHERE key IN (
+                                          SELECT key FROM (
+                                              SELECT key, SUM(size) OVER (ORDER BY last_access DESC, key) AS total
+                                              FROM responses
+                                          ) WHERE total > ?
+                                      )""", (self.max_size,))
+        return
+
+
+    def clear(self):
+        """Remove every stored response and reset the hit and miss counters."""
+        with self._connection as connection:
+            connection.execute("DELETE FROM responses")
+        with self._counter_lock:
+            self.hits = 0
+            self.misses = 0
+        return
+
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the cache usage statistics.
+
+        Returns:
+            A dictionary with the hits and misses of this process, and the number of entries and total size (in bytes)
+                currently stored.
+        """
+        with self._connection as connection:
+            entries, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'size': size}
@@ -0,0 +1,84 @@
+"""This module contains the RetryPolicy class, which decides whether and when failed gnomAD requests are retried."""
+import asyncio
+from email.utils import parsedate_to_datetime
+from random import random
+from time import time
+from typing import Any, Optional, Tuple
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout as RequestsTimeout
+
+
+class RetryPolicy:
+
+    # Errors raised by the transports when the connection drops or times out
+    retryable_errors: Tuple[type, ...] = (RequestsConnectionError, RequestsTimeout, ConnectionError, TimeoutError,
+                                          asyncio.TimeoutError)
+
+    def __init__(self,
+                 max_retries: int = 5,
+                 backoff: float = 1.0,
+                 max_backoff: float = 60.0,
+                 jitter: float = 0.5,
+                 total_budget: Optional[float] = 300.0,
+                 retry_statuses: Tuple[int, ...] = (429, 500, 502, 503, 504)):
+        """Constructor for the RetryPolicy class.
+
+        The n-th retry waits `backoff * 2**n` seconds (capped at `max_backoff`), minus a random fraction of up to
+        `jitter` of that time so that concurrent searches do not retry in lockstep. If gnomAD answers with a
+        Retry-After header, its value is used instead.
+
+        Args:
+            max_retries: The maximum number of retries of a single request. Defaults to 5.
+            backoff: The wait, in seconds, before the first retry. Defaults to 1.
+            max_backoff: The maximum wait, in seconds, between two attempts. Defaults to 60.
+            jitter: The maximum fraction of each wait removed at random, between 0 and 1. Defaults to 0.5.
+            total_budget: The maximum number of seconds spent on a request, retries included; no retry is attempted
+                if it would end past this budget. None disables the limit. Defaults to 300.
+            retry_statuses: The HTTP status codes considered transient. Defaults to 429 and the 5xx gateway errors.
+        """
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.total_budget = total_budget
+        self.retry_statuses = retry_statuses
+
+
+    def next_delay(self, attempt: int, started: float, response: Any = None) -> Optional[float]:
+        """Get how long to wait before retrying a failed request.
+
+        Args:
+            attempt: The number of retries already made for the request.
+            started: The timestamp (as given by `time.time`) of the first attempt.
+            response: The failed response, or None if the request raised one of the `retryable_errors`.
+
+        Returns:
+            The number of seconds to wait, or None if the request should not be retried.
+        """
+        if attempt >= self.max_retries:
+            return None
+        if response is not None and response.status_code not in self.retry_statuses:
+            return None
+
+        delay = self._retry_after(response)
+        if delay is None:
+            delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+            delay -= delay * self.jitter * random()
+
+        if self.total_budget is not None and time() + delay - started > self.total_budget:
+            return None
+        return delay
+
+
+    @staticmethod
+    def _retry_after(response: Any) -> Optional[float]:
+        value = response.headers.get('Retry-After') if response is not None else None
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time())
+        except (TypeError, ValueError):
+            return None
@@ -1,13 +1,29 @@
 """This module contains the Search class, which is used to search the gnomAD database."""
-from time import sleep
-from typing import Any, Union, Dict, Tuple
-from requests import post
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep, time
+from typing import Any, Optional, Union, Dict, List, Tuple
 import pandas as pd
 from pynoma.DataManager import DataManager
+from pynoma.GeneIdMap import GeneIdMap
 from pynoma.Logger import Logger
+from pynoma.RateLimiter import RateLimiter
+from pynoma.RegionCache import RegionCache
+from pynoma.ResponseCache import ResponseCache
+from pynoma.RetryPolicy import RetryPolicy
+from pynoma.Transport import Transport
+from pynoma.VariantStore import VariantStore
 
 class Search:
 
+    transport = Transport()   # pooled connections shared by every search in the process
+    rate_limiter = RateLimiter()   # request pacing shared by every search in the process
+    retry_policy = RetryPolicy()   # retries of failed requests, shared by every search in the process
+    cache: Optional[ResponseCache] = None   # opt-in persistent response cache
+    store: Optional[VariantStore] = None   # opt-in local mirror answering the searches it fully covers
+    project_fields = True   # if True, standard searches request only the fields their output needs
+    slim = False   # if True, the DataManager of each search releases the response JSON once the output is built
+
 
     dataset_id_map = {
         2: "gnomad_r2_1",
@@ -16,7 +32,9 @@ class Search:
         "hg37": "gnomad_r2_1",
         3: "gnomad_r3",
         "3": "gnomad_r3",
-        "hg38": "gnomad_r3"
+        "hg38": "gnomad_r3",
+        "gnomad_r2_1": "gnomad_r2_1",
+        "gnomad_r3": "gnomad_r3"
     }
 
     def __init__(self, dataset_version: Union[int, str], query: str, query_variables: str):
@@ -33,41 +51,248 @@ class Search:
         self.dataset_id, self.reference_genome = self.get_dataset_id(dataset_version)
 
         self.dm = None   # attribute holding DataManager object
+        self.time_waiting = 0.0   # seconds spent waiting for the rate limiter and between retries
+        self._waiting_lock = threading.Lock()   # region tiles are requested from several threads
 
     
     def request_gnomad(self, 
                        variables: Union[str, tuple], 
                        retry_on_429: bool = True,
-                       retry_sleep: int = 20
+                       retry_sleep: Optional[float] = None
                        ) -> Dict[str, Any]:
         """Send a POST request to the gnomAD API.
 
+        Failed requests are retried according to the shared retry policy (see `set_retry_policy`). The time spent
+        waiting for the rate limiter and between retries is added up in the `time_waiting` attribute. If a response
+        cache is set (see `set_cache`), stored responses are returned without contacting gnomAD.
+
         Args:
             variables: The variables to be used in the query. See examples in the Queries file.
             retry_on_429: If True, the request will be retried if gnomAD complains about too many requests.
-            retry_sleep: The number of seconds to wait before retrying the request.
+            retry_sleep: If given, the fixed number of seconds every search sharing the rate limiter waits before
+                retrying after gnomAD complains about too many requests, instead of the retry policy backoff.
 
         Returns:
             The response JSON from the gnomAD API request.
         """
-        variables = self.query_vars % variables
-
-        retry_count = 0
-        while retry_count < 5:
-            response = post(self.end_point, data={'query': self.query, 'variables': variables}, timeout=None)
-            if response.status_code == 429:
-                if not retry_on_429:
-                    Logger.too_many_requests_error(0)
-                    raise Exception("gnomAD is complaining about too many requests. Please try again later.")
-                Logger.too_many_requests_error(retry_sleep)
-                sleep(retry_sleep)
-                retry_count += 1
-                
-            elif not response.ok:
-                raise Exception(f"Request to gnomAD failed: {response}. Check your input or try again later.")
+        payload = self._build_payload(variables)
+        cache_key, json_data = self._get_cached_response(payload)
+        if json_data is not None:
+            return json_data
+
+        started = time()
+        attempt = 0
+        while True:
+            self._add_time_waiting(self.rate_limiter.acquire())
+            try:
+                response = self.transport.post(self.end_point, data=payload)
+            except self.retry_policy.retryable_errors as error:
+                response = error
+            else:
+                if response.ok:
+                    return self._store_response(cache_key, response.json())
+
+            delay = self._retry_delay(response, attempt, started, retry_on_429, retry_sleep)
+            if delay:
+                sleep(delay)
+                self._add_time_waiting(delay)
+            attempt += 1
+
+
+    def _add_time_waiting(self, seconds: float):
+        """Add up the time spent waiting by a request, which may run alongside other requests of the same search."""
+        with self._waiting_lock:
+            self.time_waiting += seconds
+        return
+
+
+    def _get_cached_response(self, payload: Dict[str, str]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """Look a request up in the response cache.
+
+        Returns:
+            The cache key of the request and its stored response, if any. The key is None if there is no cache.
+        """
+        if self.cache is None:
+            return None, None
+        cache_key = self.cache.make_key(self.end_point, payload['query'], payload['variables'], self.dataset_id)
+        return cache_key, self.cache.get(cache_key)
+
+
+    def _store_response(self, cache_key: Optional[str], json_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Store a successful response in the response cache (if any), unless gnomAD reported errors in it."""
+        if cache_key is not None and not json_data.get('errors'):
+            self.cache.put(cache_key, json_data)
+        return json_data
+
+
+    def _retry_delay(self,
+                     response: Any,
+                     attempt: int,
+                     started: float,
+                     retry_on_429: bool,
+                     retry_sleep: Optional[float]
+                     ) -> float:
+        """Decide what to do about a failed request, raising if it should not be retried.
+
+        Args:
+            response: The failed response, or the connection error raised while sending the request.
+            attempt: The number of retries already made for the request.
+            started: The timestamp of the first attempt.
+            retry_on_429: If False, too many requests errors are not retried.
+            retry_sleep: If given, the fixed wait after a too many requests error.
+
+        Returns:
+            The number of seconds the caller must wait before retrying. Too many requests errors pause the shared rate
+                limiter instead, so that every search backs off together, and 0 is returned.
+        """
+        if isinstance(response, Exception):
+            delay = self.retry_policy.next_delay(attempt, started)
+            if delay is None:
+                raise response
+            Logger.request_retry(response, delay)
+            return delay
+
+        if response.status_code == 429:
+            delay = self.retry_policy.next_delay(attempt, started, response) if retry_on_429 else None
+            if delay is not None and retry_sleep is not None:
+                delay = retry_sleep
+            if delay is None:
+                Logger.too_many_requests_error(0)
+                raise Exception("gnomAD is complaining about too many requests. Please try again later.")
+            Logger.too_many_requests_error(round(delay, 1))
+            self.rate_limiter.pause(delay)
+            return 0
+
+        delay = self.retry_policy.next_delay(attempt, started, response)
+        if delay is None:
+            raise Exception(f"Request to gnomAD failed: {response}. Check your input or try again later.")
+        Logger.request_retry(response, delay)
+        return delay
+
+
+    def _get_stored_json(self) -> Optional[Dict[str, Any]]:
+        """Get the search response from the variant store, if it covers the search. By default, there is none."""
+        return None
+
+
+    def _set_projection(self, *args, **kwargs):
+        """Select the query fields needed by `get_data` called with the given arguments. By default, nothing changes."""
+        return
+
+
+    def _project_variants_query(self,
+                                target: str,
+                                preset: str,
+                                standard: bool = True,
+                                additional_population_info: bool = False
+                                ) -> str:
+        """Get the variants query holding only the fields needed by a region, gene or transcript search output.
+
+        Args:
+            target: The top-level field of the query: 'region', 'gene' or 'transcript'.
+            preset: The full query of the search, used for the raw output (or if `project_fields` is False).
+            standard: Whether the standard dataframe is requested.
+            additional_population_info: Whether the population frequencies are requested.
+
+        Returns:
+            The query text.
+        """
+        from pynoma.Queries import (build_variants_query, standard_variant_fields, standard_frequency_fields,
+                                    standard_population_fields, population_fields)
+        if not (standard and self.project_fields):
+            return preset
+        populations = population_fields if additional_population_info else standard_population_fields
+        return build_variants_query(target, standard_variant_fields, standard_frequency_fields, populations)
+
+
+    def _get_variants_output(self,
+                             standard: bool = True,
+                             additional_population_info: bool = False
+                             ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Get the output of a region, gene or transcript search `get_data` from the search's DataManager.
+
+        If the searches are slim, the DataManager then releases the response JSON, keeping only the output.
+        """
+        if standard:
+            if additional_population_info:
+                output = self.dm.get_additional_pop_info_df('standard'), self.dm.clinical_df
+            else:
+                output = self.dm.standard_df, self.dm.clinical_df
+        else:
+            if additional_population_info:
+                output = self.dm.get_additional_pop_info_df('raw'), self.dm.clinical_df
             else:
-                break
-        return response.json()
+                output = self.dm.raw_df, self.dm.clinical_df
+
+        if self.slim:
+            self.dm.release()
+        return output
+
+
+    def _build_payload(self, variables: Union[str, tuple]) -> Dict[str, str]:
+        """Build the POST form data sending the search query along with its formatted variables."""
+        return {'query': self.query, 'variables': self.query_vars % variables}
+
+
+    @classmethod
+    def set_transport(cls, transport: Transport):
+        """Replace the transport shared by all Search objects (e.g. to change the connection pool size).
+
+        Args:
+            transport: The Transport object to be used by every search from now on.
+        """
+        Search.transport = transport
+        return
+
+
+    @classmethod
+    def set_cache(cls, cache: Optional[ResponseCache]):
+        """Set the response cache shared by all Search objects.
+
+        Args:
+            cache: The ResponseCache object to be used by every search from now on, or None to disable caching.
+        """
+        Search.cache = cache
+        return
+
+
+    @classmethod
+    def set_store(cls, store: Optional[VariantStore]):
+        """Set the variant store answering the region, gene and transcript searches it fully covers, offline.
+
+        The Ensembl IDs of the gene symbols it mirrored are added to the map shared by all gene searches
+        (`GeneSearch.gene_ids`), so that mirrored genes searched by symbol don't need a lookup request either.
+
+        Args:
+            store: The VariantStore object to be used by every search from now on, or None to always query gnomAD.
+        """
+        Search.store = store
+        if store is not None:
+            for reference_genome, ensembl_ids in store.gene_ids().items():
+                GeneSearch.gene_ids.update(reference_genome, ensembl_ids)
+        return
+
+
+    @classmethod
+    def set_retry_policy(cls, retry_policy: RetryPolicy):
+        """Replace the retry policy shared by all Search objects.
+
+        Args:
+            retry_policy: The RetryPolicy object to be used by every search from now on.
+        """
+        Search.retry_policy = retry_policy
+        return
+
+
+    @classmethod
+    def set_rate_limiter(cls, rate_limiter: RateLimiter):
+        """Replace the rate limiter shared by all Search objects (e.g. to change the requests per second).
+
+        Args:
+            rate_limiter: The RateLimiter object to be used by every search from now on.
+        """
+        Search.rate_limiter = rate_limiter
+        return
 
     
     @classmethod
@@ -99,18 +324,28 @@ class Search:
 
 class RegionSearch(Search):
 
+    region_cache: Optional[RegionCache] = None   # opt-in cache of the fetched variants, sliced by position
+
     def __init__(self, 
                  dataset_version: Union[int, str],
                  chromosome: Union[int, str], 
                  start_position: Union[int, str], 
-                 end_position: Union[int, str]):
+                 end_position: Union[int, str],
+                 tile_size: Optional[int] = 500000,
+                 tile_workers: int = 4):
         """Constructor for the RegionSearch class.
+
+        Regions longer than `tile_size` bases are fetched in consecutive tiles of that size, `tile_workers` of them at
+        a time (as allowed by the rate limiter), and merged back into a single response.
         
         Args:
             dataset_version: The version of the gnomAD dataset to be used. It can be either 2, 3 or hg19/h38
             chromosome: The chromosome number to search for.
             start_position: The start position of the region to search for.
             end_position: The end position of the region to search for.
+            tile_size: The maximum number of bases requested at once. If None, the whole region is requested at once.
+                Defaults to 500000.
+            tile_workers: The maximum number of tiles requested concurrently. Defaults to 4.
         """
         from pynoma.Queries import in_region_v3, in_region_v2, in_region_variables
         super().__init__(dataset_version, "", in_region_variables)
@@ -123,12 +358,132 @@ class RegionSearch(Search):
         self.chromosome = str(chromosome)
         self.start = str(start_position)
         self.end = str(end_position)
+        self.tile_size = tile_size
+        self.tile_workers = tile_workers
 
 
     def get_json(self) -> dict:
-        """Get the JSON data from the gnomAD API."""
-        variables = (self.chromosome, self.dataset_id, self.reference_genome, self.start, self.end)
-        return self.request_gnomad(variables)
+        """Get the JSON data from the gnomAD API, requesting the region tiles concurrently.
+
+        If the variant store covers the whole region, it is read from the store instead. If there is a region cache,
+        only the parts of the region not covered by it are requested.
+        """
+        stored = self._get_stored_json()
+        if stored is not None:
+            return stored
+        ranges = self._get_missing_ranges()
+        while True:
+            tiles = [tile for start, end in ranges for tile in self._get_tiles(start, end)]
+            if len(tiles) == 1 and self.region_cache is None:
+                return self.request_gnomad(self._get_variables())
+            with ThreadPoolExecutor(max_workers=self.tile_workers) as executor:
+                responses = list(executor.map(lambda tile: self.request_gnomad(self._get_variables(*tile)), tiles))
+            json_data = self._build_region_response(ranges, responses)
+            if json_data is not None:
+                return json_data
+            # Cached parts of the region were evicted in the meantime, so the whole region is requested instead
+            ranges = [(int(self.start), int(self.end))]
+
+
+    def _get_variables(self, start: Union[int, str, None] = None, end: Union[int, str, None] = None) -> tuple:
+        """Get the values to be formatted into the query variables, for the whole region or for a part of it."""
+        return (self.chromosome, self.dataset_id, self.reference_genome,
+                self.start if start is None else str(start), self.end if end is None else str(end))
+
+
+    def _get_tiles(self, start: int, end: int) -> List[Tuple[int, int]]:
+        """Split a range of the region into consecutive (start, end) tiles of up to `tile_size` bases."""
+        if not self.tile_size or end - start + 1 <= self.tile_size:
+            return [(start, end)]
+        return [(tile_start, min(tile_start + self.tile_size - 1, end))
+                for tile_start in range(start, end + 1, self.tile_size)]
+
+
+    def _get_stored_json(self) -> Optional[Dict[str, Any]]:
+        """Get the region search response from the variant store, if it covers the whole region."""
+        if self.store is None:
+            return None
+        return self.store.get_region(self.dataset_id, self.chromosome, int(self.start), int(self.end))
+
+
+    def _is_stored(self) -> bool:
+        """Check whether the variant store covers the whole region."""
+        return self.store is not None and not self.store.missing(self.dataset_id, self.chromosome,
+                                                                 int(self.start), int(self.end))
+
+
+    def _get_region_cache_key(self) -> tuple:
+        """Get the key of the region cache under which this search's results are kept."""
+        return (self.dataset_id, self.chromosome, self.query)
+
+
+    def _get_missing_ranges(self) -> List[Tuple[int, int]]:
+        """Get the (start, end) ranges of the region to be requested: the whole region, or the gaps of the cache."""
+        start, end = int(self.start), int(self.end)
+        if self.region_cache is None:
+            return [(start, end)]
+        return self.region_cache.missing(self._get_region_cache_key(), start, end)
+
+
+    def _build_region_response(self,
+                               ranges: List[Tuple[int, int]],
+                               responses: List[Dict[str, Any]]
+                               ) -> Optional[Dict[str, Any]]:
+        """Build the response of the whole region from the responses of the requested tiles (and the region cache).
+
+        Returns None if other searches evicted cached parts of the region since its missing ranges were computed. The
+        response of ranges covering the whole region is always built.
+        """
+        json_data = self._merge_tiles(responses)
+        if self.region_cache is None or not json_data['data'].get('region'):
+            return json_data
+
+        key, start, end = self._get_region_cache_key(), int(self.start), int(self.end)
+        if ranges:
+            region = self.region_cache.add(key, ranges, json_data['data']['region'], start, end)
+        else:
+            region = self.region_cache.get(key, start, end)
+        return None if region is None else {'data': {'region': region}}
+
+
+    @classmethod
+    def set_region_cache(cls, region_cache: Optional[RegionCache]):
+        """Set the region cache shared by all RegionSearch objects.
+
+        Args:
+            region_cache: The RegionCache object to be used by every region search from now on, or None to disable it.
+        """
+        RegionSearch.region_cache = region_cache
+        return
+
+
+    @staticmethod
+    def _merge_tiles(responses: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Merge the responses of the region tiles, in order, into the response of the whole region.
+
+        Variants returned by more than one tile (e.g. deletions spanning a tile boundary) are kept only once. If any
+        tile failed, its response is returned instead.
+        """
+        merged: Dict[str, List[Dict[str, Any]]] = {'variants': [], 'clinvar_variants': []}
+        seen: Dict[str, set] = {}
+        for json_data in responses:
+            if not (json_data.get('data') or {}).get('region'):
+                return json_data
+            for key, items in json_data['data']['region'].items():
+                merged.setdefault(key, [])
+                seen.setdefault(key, set())
+                for item in items or []:
+                    if item['variant_id'] not in seen[key]:
+                        seen[key].add(item['variant_id'])
+                        merged[key].append(item)
+        return {'data': {'region': merged}}
+
+
+    def _set_projection(self, standard=True, additional_population_info=False):
+        """Select the query fields needed by `get_data` called with the given arguments."""
+        from pynoma.Queries import in_region_v3, in_region_v2
+        preset = in_region_v2 if self.dataset_id == "gnomad_r2_1" else in_region_v3
+        self.query = self._project_variants_query('region', preset, standard, additional_population_info)
 
     
     def get_data(self, 
@@ -148,32 +503,36 @@ class RegionSearch(Search):
                 is the clinical dataframe. If no data is found or if the gene_ens_id is not provided, both dataframes
                 will be None.
         """
-        json_data = self.get_json()
+        self._set_projection(standard, additional_population_info)
+        return self._process_json(self.get_json(), standard, additional_population_info)
+
+
+    def _process_json(self,
+                      json_data: Dict[str, Any],
+                      standard=True,
+                      additional_population_info=False
+                      ) -> Tuple[Union[pd.DataFrame, None], Union[pd.DataFrame, None]]:
+        """Build the output dataframes of `get_data` from the response JSON."""
         if not json_data['data']['region']['variants']:
             Logger.no_variants_found()
             return (None, None)
 
         self.dm = DataManager(json_data, self.dataset_id)
-
-        if standard:
-            self.dm.process_standard_dataframe()
-            if additional_population_info:
-                return self.dm.get_additional_pop_info_df('standard'), self.dm.clinical_df
-            return self.dm.standard_df, self.dm.clinical_df  # TODO: investigate linter type-checking complaint
-        
-        else:
-            if additional_population_info:
-                return self.dm.get_additional_pop_info_df('raw'), self.dm.clinical_df
-            return self.dm.raw_df, self.dm.clinical_df
+        return self._get_variants_output(standard, additional_population_info)
 
 
 
 
 class GeneSearch(Search):
 
+    gene_ids = GeneIdMap()   # Ensembl IDs of the gene symbols already resolved, shared by every gene search
+
     def __init__(self, dataset_version: Union[int, str], gene: str):
         """Constructor for the GeneSearch class.
 
+        No request is made here: the gene's Ensembl ID is resolved when the data is first requested (or beforehand,
+        for many searches at once, with `prefetch_gene_ids`).
+
         Args:
             dataset_version: The version of the gnomAD dataset to be used. It can be either 2, 3 or hg19/h38.
             gene: The gene name to search for.
@@ -183,12 +542,6 @@ class GeneSearch(Search):
         
         self.gene = gene
         self.gene_ens_id = None
-        if not self.get_ensembl_id():
-            return 
-
-        from pynoma.Queries import variant_in_gene, variant_in_gene_variables
-        self.query = variant_in_gene
-        self.query_vars = variant_in_gene_variables
 
 
     def get_ensembl_id(self) -> bool:
@@ -197,13 +550,44 @@ class GeneSearch(Search):
         Returns:
             True if the gene name is valid, False otherwise.
         """
+        gene_ens_id = self.gene_ids.get(self.reference_genome, self.gene)
+        if gene_ens_id:
+            return self._use_ensembl_id(gene_ens_id)
         json_data = self.request_gnomad((self.gene, self.reference_genome))
+        return self._set_ensembl_id(json_data)
+
+    def _set_ensembl_id(self, json_data: Dict[str, Any]) -> bool:
+        """Store the Ensembl ID found in a `gene_id` query response and switch to the variants query.
+
+        Returns:
+            True if the response holds a gene, False otherwise.
+        """
         if not json_data['data']['gene_search']:
             Logger.no_gene_found_with_given_name(self.gene)
             return False
-        self.gene_ens_id: str = json_data['data']['gene_search'][0]['ensembl_id']
+        gene_ens_id = json_data['data']['gene_search'][0]['ensembl_id']
+        self.gene_ids.update(self.reference_genome, {self.gene: gene_ens_id})
+        return self._use_ensembl_id(gene_ens_id)
+
+    def _use_ensembl_id(self, gene_ens_id: str) -> bool:
+        """Set the gene's Ensembl ID and switch to the variants query."""
+        self.gene_ens_id: str = gene_ens_id
+
+        from pynoma.Queries import variant_in_gene, variant_in_gene_variables
+        self.query = variant_in_gene
+        self.query_vars = variant_in_gene_variables
         return True
 
+    @classmethod
+    def set_gene_ids(cls, gene_ids: GeneIdMap):
+        """Replace the map of resolved Ensembl IDs shared by all GeneSearch objects (e.g. to persist it in a file).
+
+        Args:
+            gene_ids: The GeneIdMap object to be used by every gene search from now on.
+        """
+        GeneSearch.gene_ids = gene_ids
+        return
+
     def get_gene_information(self):
         """Get information about the gene from the gnomAD API to actually make the query."""
         gene_info = self.request_gnomad(self.gene_ens_id)
@@ -213,9 +597,33 @@ class GeneSearch(Search):
         return
 
     def get_json(self) -> Dict[str, Any]:
-        """Get the JSON data from the gnomAD API."""
-        variables = (self.dataset_id, self.gene_ens_id)
-        return self.request_gnomad(variables)
+        """Get the JSON data from the gnomAD API.
+
+        If the gene symbol is not found, no gene query is sent and the gene data is None, as gnomAD returns it.
+        """
+        if not self.gene_ens_id and not self.get_ensembl_id():
+            return {'data': {'gene': None}}
+        stored = self._get_stored_json()
+        if stored is not None:
+            return stored
+        return self.request_gnomad(self._get_variables())
+
+    def _get_variables(self) -> tuple:
+        """Get the values to be formatted into the query variables."""
+        return (self.dataset_id, self.gene_ens_id)
+
+    def _get_stored_json(self) -> Optional[Dict[str, Any]]:
+        """Get the gene search response from the variant store, if the gene was mirrored."""
+        if self.store is None or not self.gene_ens_id:
+            return None
+        return self.store.get_scope(self.dataset_id, self.gene_ens_id, 'gene')
+
+    def _set_projection(self, standard: bool = True, additional_population_info: bool = False):
+        """Select the query fields needed by `get_data` called with the given arguments."""
+        if not self.gene_ens_id:
+            return
+        from pynoma.Queries import variant_in_gene
+        self.query = self._project_variants_query('gene', variant_in_gene, standard, additional_population_info)
 
     def get_data(self, 
                  standard: bool = True,
@@ -236,25 +644,23 @@ class GeneSearch(Search):
                 is the clinical dataframe. If no data is found or if the gene_ens_id is not provided, both dataframes
                 will be None.
         """
-        if not self.gene_ens_id:
+        if not self.gene_ens_id and not self.get_ensembl_id():
             return (None, None)
-        json_data = self.get_json()
+        self._set_projection(standard, additional_population_info)
+        return self._process_json(self.get_json(), standard, additional_population_info)
+
+    def _process_json(self,
+                      json_data: Dict[str, Any],
+                      standard: bool = True,
+                      additional_population_info: bool = False
+                      ) -> Tuple[Union[pd.DataFrame, None], Union[pd.DataFrame, None]]:
+        """Build the output dataframes of `get_data` from the response JSON."""
         if not json_data['data']['gene']['variants']:
             Logger.no_variants_found()
             return (None, None)
 
         self.dm = DataManager(json_data, self.dataset_id, second_level_key='gene')
-
-        if standard:
-            self.dm.process_standard_dataframe()
-            if additional_population_info:
-                return self.dm.get_additional_pop_info_df('standard'), self.dm.clinical_df
-            return self.dm.standard_df, self.dm.clinical_df  # TODO: investigate type-checking complaint
-
-        else:
-            if additional_population_info:
-                return self.dm.get_additional_pop_info_df('raw'), self.dm.clinical_df
-            return self.dm.raw_df, self.dm.clinical_df
+        return self._get_variants_output(standard, additional_population_info)
 
 
 
@@ -287,34 +693,49 @@ class TranscriptSearch(Search):
                 is the clinical dataframe. If no data is found or if the gene_ens_id is not provided, both dataframes
                 will be None.
         """
-        json_data = self.get_json()
-
+        self._set_projection(standard, additional_population_info)
+        return self._process_json(self.get_json(), standard, additional_population_info)
+
+    def _process_json(self,
+                      json_data: Dict[str, Any],
+                      standard: bool = True,
+                      additional_population_info: bool = False
+                      ) -> Tuple[Union[pd.DataFrame, None], Union[pd.DataFrame, None]]:
+        """Build the output dataframes of `get_data` from the response JSON."""
         if not json_data['data']['transcript']['variants']:
             Logger.no_variants_found_for_given_transcript(self.transcript)
             return (None, None)
 
         json_data['data']['region'] = json_data['data'].pop('transcript')
         self.dm = DataManager(json_data, self.dataset_id)
-
-        if standard:
-            self.dm.process_standard_dataframe()
-            if additional_population_info:
-                return self.dm.get_additional_pop_info_df('standard'), self.dm.clinical_df
-            return self.dm.standard_df, self.dm.clinical_df  # TODO: investigate type-checking complaint
-        
-        else:
-            if additional_population_info:
-                return self.dm.get_additional_pop_info_df('raw'), self.dm.clinical_df
-            return self.dm.raw_df, self.dm.clinical_df
+        return self._get_variants_output(standard, additional_population_info)
         
     def get_json(self) -> Dict[str, Any]:
         """Get the JSON data from the gnomAD API.
 
         Returns:
-            The response JSON from the gnomAD API request.
+            The response JSON from the gnomAD API request (or from the variant store, if the transcript was mirrored).
         """
-        variables = (self.dataset_id, self.transcript)
-        return self.request_gnomad(variables)
+        stored = self._get_stored_json()
+        if stored is not None:
+            return stored
+        return self.request_gnomad(self._get_variables())
+
+    def _get_variables(self) -> tuple:
+        """Get the values to be formatted into the query variables."""
+        return (self.dataset_id, self.transcript)
+
+    def _get_stored_json(self) -> Optional[Dict[str, Any]]:
+        """Get the transcript search response from the variant store, if the transcript was mirrored."""
+        if self.store is None:
+            return None
+        return self.store.get_scope(self.dataset_id, self.transcript, 'transcript')
+
+    def _set_projection(self, standard: bool = True, additional_population_info: bool = False):
+        """Select the query fields needed by `get_data` called with the given arguments."""
+        from pynoma.Queries import variant_in_transcript
+        self.query = self._project_variants_query('transcript', variant_in_transcript, standard,
+                                                  additional_population_info)
     
 
 
@@ -339,8 +760,12 @@ class VariantSearch(Search):
             Returns:
                 The response JSON from the gnomAD API request.
         """
-        variables = (self.dataset_id, self.variant_id)
-        return self.request_gnomad(variables)
+        return self.request_gnomad(self._get_variables())
+
+
+    def _get_variables(self) -> tuple:
+        """Get the values to be formatted into the query variables."""
+        return (self.dataset_id, self.variant_id)
 
 
     def get_data(self, raw: bool = False) -> Tuple[Union[pd.DataFrame, dict, None], Union[pd.DataFrame, None]]:
@@ -354,7 +779,14 @@ class VariantSearch(Search):
                 is the clinical dataframe. If no data is found or if the gene_ens_id is not provided, both dataframes
                 will be None. If raw is True, the (raw JSON, None) tuple will be returned instead of the dataframes.
         """
-        json_data = self.get_json()
+        return self._process_json(self.get_json(), raw)
+
+
+    def _process_json(self,
+                      json_data: Dict[str, Any],
+                      raw: bool = False
+                      ) -> Tuple[Union[pd.DataFrame, dict, None], Union[pd.DataFrame, None]]:
+        """Build the output of `get_data` from the response JSON."""
         if not json_data['data']['variant']:
             Logger.variant_not_found(self.variant_id)
             return (None, None)
@@ -363,4 +795,7 @@ class VariantSearch(Search):
             return json_data, None
         else:
             self.dm = DataManager(json_data, self.dataset_id, variant_search=True)
-            return self.dm.standard_df, self.dm.variant_metadata  # TODO: investigate type-checking complaint
+            output = self.dm.standard_df, self.dm.variant_metadata  # TODO: investigate type-checking complaint
+            if self.slim:
+                self.dm.release()
+            return output
@@ -0,0 +1,166 @@
+"""This module contains the Transport classes, which hold the pooled HTTP connections used to talk to gnomAD."""
+import asyncio
+import json
+import threading
+import weakref
+from typing import Any, Dict, Optional, Union
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+
+
+class Transport:
+
+    def __init__(self, pool_size: int = 10, pool_block: bool = True, timeout: Optional[float] = None):
+        """Constructor for the Transport class.
+
+        A single connection pool is shared by every thread using the transport. Each thread gets its own
+        `requests.Session` (sessions are not thread-safe), but all of them are mounted on the same adapter, so the
+        keep-alive connections are reused no matter which thread issues the request.
+
+        Args:
+            pool_size: The maximum number of connections kept alive to the gnomAD host. Defaults to 10.
+            pool_block: If True, threads wait for a free connection instead of opening throwaway ones when the pool
+                is exhausted. Defaults to True.
+            timeout: The timeout, in seconds, applied to every request. Defaults to None (wait forever).
+        """
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=pool_block)
+        self._local = threading.local()
+
+
+    @property
+    def session(self) -> Session:
+        """The calling thread's session, created on first use and mounted on the shared adapter."""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = Session()
+            session.mount("https://", self.adapter)
+            session.mount("http://", self.adapter)
+            self._local.session = session
+        return session
+
+
+    def post(self, url: str, data: Union[Dict[str, Any], str]) -> Response:
+        """Send a POST request through the pooled connections.
+
+        Args:
+            url: The URL to send the request to.
+            data: The form data (or raw body) of the request.
+
+        Returns:
+            The response of the request.
+        """
+        return self.session.post(url, data=data, timeout=self.timeout)
+
+
+    def close(self):
+        """Close every pooled connection. The transport can still be used afterwards, reconnecting on demand."""
+        self.adapter.close()
+        self._local = threading.local()
+        return
+
+
+
+class AsyncResponse:
+
+    def __init__(self, status_code: int, headers: Dict[str, str], body: bytes):
+        """Constructor for the AsyncResponse class, a fully read response mimicking the `requests.Response` interface.
+
+        Args:
+            status_code: The HTTP status code of the response.
+            headers: The response headers.
+            body: The raw response body.
+        """
+        self.status_code = status_code
+        self.headers = headers
+        self.content = body
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def __repr__(self) -> str:
+        return f"<Response [{self.status_code}]>"
+
+
+
+class AsyncTransport:
+
+    def __init__(self, pool_size: int = 100, timeout: Optional[float] = None):
+        """Constructor for the AsyncTransport class.
+
+        The `aiohttp` session is created on first use inside the running event loop (and recreated if a later call runs
+        on a different loop, e.g. after a new `asyncio.run`), so the transport itself can be built at import time. The
+        session of a loop is closed when the loop shuts down.
+
+        Args:
+            pool_size: The maximum number of simultaneous connections to the gnomAD host. Defaults to 100.
+            timeout: The total timeout, in seconds, applied to every request. Defaults to None (wait forever).
+        """
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session = None
+        self._loop = None
+        self._closers = weakref.WeakKeyDictionary()
+
+
+    async def _get_session(self):
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError("The asynchronous searches require the aiohttp package: pip install aiohttp")
+
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size),
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._loop = loop
+
+            # Each session is closed when its loop shuts down its async generators (e.g. at the end of asyncio.run),
+            # so the sessions of finished loops don't leak their connections
+            closer = self._close_at_shutdown(self._session)
+            await closer.__anext__()
+            self._closers[loop] = closer
+        return self._session
+
+
+    @staticmethod
+    async def _close_at_shutdown(session):
+        try:
+            yield
+        finally:
+            if not session.closed:
+                await session.close()
+
+
+    async def post(self, url: str, data: Union[Dict[str, Any], str]) -> AsyncResponse:
+        """Send a POST request through the pooled connections.
+
+        Args:
+            url: The URL to send the request to.
+            data: The form data (or raw body) of the request.
+
+        Returns:
+            The fully read response of the request.
+        """
+        import aiohttp
+
+        try:
+            async with (await self._get_session()).post(url, data=data) as response:
+                body = await response.read()
+                return AsyncResponse(response.status, dict(response.headers), body)
+        except aiohttp.ClientConnectionError as error:
+            raise ConnectionError(str(error)) from error
+
+
+    async def close(self):
+        """Close the session and its pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+        return
@@ -0,0 +1,151 @@
+"""This module contains the VariantColumns class, a columnar (struct of arrays) view of a gnomAD variants list."""
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Set, Tuple
+import numpy as np
+import pandas as pd
+
+
+SEQUENCING_TYPES = ('exome', 'genome')
+SEQUENCING_FIELDS = ('ac', 'an', 'af')
+POPULATION_FIELDS = ('ac', 'an', 'ac_hom', 'ac_hemi')
+
+# Variant keys pack the chromosome code, the position and a hash of the whole variant ID in a non-negative int64
+CHROMOSOME_CODES = {**{str(i): i for i in range(1, 23)}, 'X': 23, 'Y': 24, 'M': 25, 'MT': 25}
+POSITION_BITS = 28
+HASH_BITS = 30
+
+
+def split_variant_ids(variant_ids: Iterable[str]) -> Tuple[List[str], List[str], List[str], List[str]]:
+    """Split 'chromosome-position-reference-alternative' variant IDs into their four pieces.
+
+    All the IDs are split at once, by a single `str.split` of their concatenation.
+
+    Returns:
+        The lists of chromosomes, positions, reference alleles and alternative alleles, as strings.
+    """
+    variant_ids = list(variant_ids)
+    pieces = '-'.join(variant_ids).split('-')
+    if len(pieces) != 4 * len(variant_ids):
+        raise Exception("Variant IDs should be in the chromosome-position-reference-alternative format.")
+    return pieces[0::4], pieces[1::4], pieces[2::4], pieces[3::4]
+
+
+def variant_keys(variant_ids: Iterable[str]) -> np.ndarray:
+    """Pack variant IDs into int64 keys, so that joins, deduplication and sorting use integers instead of strings.
+
+    A key holds the chromosome code (1-22, 23 for X, 24 for Y, 25 for M and 0 for others) in its highest bits,
+    followed by the position and a 30-bit hash of the variant ID, which tells apart the alleles at the same position.
+    The keys are deterministic, so they can be compared across sessions, and sorting them orders the variants by
+    chromosome and position.
+
+    Returns:
+        An int64 array with the key of each variant ID.
+    """
+    variant_ids = np.array(list(variant_ids), dtype=object)
+    chromosomes, positions, _, _ = split_variant_ids(variant_ids)
+    chromosome_codes = pd.Series(chromosomes, dtype=object).map(CHROMOSOME_CODES).fillna(0).to_numpy(np.int64)
+    positions = np.array(positions, dtype=np.int64)
+    if (positions >= 1 << POSITION_BITS).any():
+        raise Exception(f"Variant positions should be lower than {1 << POSITION_BITS} to be packed into keys.")
+
+    hashes = (pd.util.hash_array(variant_ids) & np.uint64((1 << HASH_BITS) - 1)).astype(np.int64)
+    return (chromosome_codes << (POSITION_BITS + HASH_BITS)) | (positions << HASH_BITS) | hashes
+
+
+class VariantColumns:
+
+    def __init__(self, variants: List[Dict[str, Any]]):
+        """Constructor for the VariantColumns class.
+
+        The variants list of a region, gene or transcript response is flattened into typed columns:
+
+        - `fields`: a dataframe with a typed column per scalar variant field (variant_id, rsid, pos, ...), holding NaN
+          for the variants missing the field;
+        - `variant_ids`: an object array with the ID of each variant, whether the field is variant_id or variantId;
+        - `sequencing[sequencing_type]`, for 'exome' and 'genome': the original data blocks (None when missing), a
+          `present` mask and int64/float64 arrays of their ac, an and af (0 when missing);
+        - `populations[sequencing_type]`: one entry per (variant, population) pair of that data, as the arrays `row`
+          (the variant index), `population` (the index in `population_ids`), and int64 arrays of ac, an, ac_hom and
+          ac_hemi (0 when missing);
+        - `population_fields`: the fields the populations were requested with (projected queries may leave some out).
+
+        Args:
+            variants: The 'variants' list of a gnomAD response.
+        """
+        self.n_variants = len(variants)
+
+        # All the variant fields, in order of first appearance; the scalar ones are typed by pandas straight from
+        # the variants, skipping the nested exome and genome data
+        self.keys: List[str] = list(dict.fromkeys(chain.from_iterable(variants)))
+        nested = [key for key in self.keys if key in SEQUENCING_TYPES]
+        self.fields: pd.DataFrame = pd.DataFrame.from_records(variants, columns=self.keys, exclude=nested,
+                                                              nrows=self.n_variants)
+        # The variant pages of variant searches hold the ID as variantId, the other variants as variant_id
+        id_key = next((key for key in ('variant_id', 'variantId') if key in self.fields), None)
+        self.variant_ids: np.ndarray = (np.asarray(self.fields[id_key], dtype=object) if id_key
+                                        else np.full(self.n_variants, None, dtype=object))
+
+        self.sequencing: Dict[str, Dict[str, Any]] = {}
+        flat_populations: Dict[str, List[Dict[str, Any]]] = {}
+        population_counts: Dict[str, List[int]] = {}
+        for sequencing_type in SEQUENCING_TYPES:
+            blocks = [variant.get(sequencing_type) for variant in variants]
+            blocks = [block if isinstance(block, dict) else None for block in blocks]
+            present = np.fromiter((block is not None for block in blocks), dtype=bool, count=self.n_variants)
+            existing = [block for block in blocks if block is not None]
+
+            sequencing = {'blocks': blocks, 'present': present}
+            for field in SEQUENCING_FIELDS:
+                dtype = np.float64 if field == 'af' else np.int64
+                sequencing[field] = np.zeros(self.n_variants, dtype=dtype)
+                sequencing[field][present] = np.fromiter((block.get(field) or 0 for block in existing),
+                                                         dtype=dtype, count=len(existing))
+            self.sequencing[sequencing_type] = sequencing
+
+            # The populations of all the variants are flattened in a single list
+            pops = [block.get('populations') or [] for block in existing]
+            population_counts[sequencing_type] = [len(variant_pops) for variant_pops in pops]
+            flat_populations[sequencing_type] = [pop for variant_pops in pops for pop in variant_pops]
+
+        # Population ids are coded in order of first appearance, shared by exome and genome
+        ids = [pop.get('id') for sequencing_type in SEQUENCING_TYPES for pop in flat_populations[sequencing_type]]
+        codes, uniques = pd.factorize(pd.Series(ids, dtype=object))   # ids are never null
+        self.population_ids: List[str] = list(uniques)
+        first = next((pops[0] for pops in flat_populations.values() if pops), {})
+        self.population_fields: Set[str] = set(first)   # every population entry has the same fields
+
+        self.populations: Dict[str, Dict[str, np.ndarray]] = {}
+        start = 0
+        for sequencing_type in SEQUENCING_TYPES:
+            pops = flat_populations[sequencing_type]
+            owners = np.flatnonzero(self.sequencing[sequencing_type]['present'])
+            populations = {
+                'row': np.repeat(owners, population_counts[sequencing_type]).astype(np.int64),
+                'population': codes[start:start+len(pops)].astype(np.int64)
+            }
+            start += len(pops)
+
+            for field in POPULATION_FIELDS:
+                populations[field] = np.fromiter((pop.get(field) or 0 for pop in pops),
+                                                 dtype=np.int64, count=len(pops))
+            self.populations[sequencing_type] = populations
+
+
+    def population_totals(self, sequencing_type: str, field: str) -> np.ndarray:
+        """Sum a population field (e.g. 'ac_hom') over the populations of each variant.
+
+        Returns:
+            An int64 array with the total of each variant (0 for the variants missing that sequencing data).
+        """
+        populations = self.populations[sequencing_type]
+        totals = np.bincount(populations['row'], weights=populations[field], minlength=self.n_variants)
+        return totals.astype(np.int64)
+
+
+    def population_matrix(self, sequencing_type: str, field: str) -> np.ndarray:
+        """Arrange a population field (e.g. 'ac') as a (variants x population_ids) float64 matrix, 0 when missing."""
+        populations = self.populations[sequencing_type]
+        n_populations = len(self.population_ids)
+        cells = populations['row'] * n_populations + populations['population']
+        matrix = np.bincount(cells, weights=populations[field], minlength=self.n_variants * n_populations)
+        return matrix.astype(np.float64).reshape(self.n_variants, n_populations)
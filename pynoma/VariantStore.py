@@ -0,0 +1,253 @@
+"""This module contains the VariantStore class, a local Parquet mirror of gnomAD variants answering searches offline."""
+import json
+import os
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+TABLES = ('variants', 'clinvar_variants')
+REGION_SCOPE = 'region'
+
+
+class VariantStore:
+
+    def __init__(self, path: str = os.path.join(os.path.expanduser("~"), ".cache", "pynoma", "variants"),
+                 row_group_size: int = 10000):
+        """Constructor for the VariantStore class.
+
+        Keeps the variants and ClinVar variants of mirrored region, gene and transcript searches in Parquet files
+        partitioned by table, dataset and chromosome (e.g. `variants/dataset=gnomad_r3/chromosome=4/`). Each row holds
+        the scope it was fetched for ('region', or the gene or transcript ID), the position, the variant ID and the
+        full variant record as JSON text. Files are sorted by scope and position, so the row group statistics let
+        lookups skip everything outside the requested scope and positions. A manifest file records the mirrored
+        intervals, genes and transcripts, so that only fully mirrored searches are answered locally, along with the
+        Ensembl IDs of the mirrored gene symbols, so that later sessions don't need to look them up (see `gene_ids`).
+
+        Requires pyarrow (`pip install pyarrow`).
+
+        Args:
+            path: The directory of the store. Defaults to ~/.cache/pynoma/variants.
+            row_group_size: The maximum number of rows per Parquet row group. Defaults to 10000.
+        """
+        self.path = path
+        self.row_group_size = row_group_size
+        self._lock = threading.Lock()
+        self._manifest_path = os.path.join(path, 'manifest.json')
+
+        os.makedirs(path, exist_ok=True)
+        self._manifest: Dict[str, Dict[str, Any]] = {'regions': {}, 'scopes': {}, 'gene_ids': {}}
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path) as file:
+                self._manifest.update(json.load(file))
+
+
+    def missing(self, dataset_id: str, chromosome: str, start: int, end: int) -> List[Tuple[int, int]]:
+        """Get the (start, end) gaps of a region not mirrored yet, in order."""
+        gaps = []
+        with self._lock:
+            intervals = self._manifest['regions'].get(dataset_id, {}).get(str(chromosome), [])
+            for interval_start, interval_end in intervals:
+                if interval_end < start:
+                    continue
+                if interval_start > end:
+                    break
+                if interval_start > start:
+                    gaps.append((start, interval_start - 1))
+                start = max(start, interval_end + 1)
+        if start <= end:
+            gaps.append((start, end))
+        return gaps
+
+
+    def get_region(self, dataset_id: str, chromosome: str, start: int, end: int) -> Optional[Dict[str, Any]]:
+        """Get the mirrored region search response, or None if the region is not fully mirrored."""
+        if self.missing(dataset_id, chromosome, start, end):
+            return None
+        region = self._read(dataset_id, str(chromosome), REGION_SCOPE, start, end)
+        return {'data': {'region': region}}
+
+
+    def get_scope(self, dataset_id: str, scope_id: str, second_level_key: str) -> Optional[Dict[str, Any]]:
+        """Get the mirrored gene or transcript search response, or None if it was not mirrored.
+
+        Args:
+            dataset_id: The gnomAD dataset ID.
+            scope_id: The Ensembl ID of the gene or transcript.
+            second_level_key: The key of the response data, 'gene' or 'transcript'.
+        """
+        with self._lock:
+            scopes = self._manifest['scopes'].get(dataset_id, {})
+            if scope_id not in scopes:
+                return None
+            chromosome = scopes[scope_id]
+        if chromosome is None:
+            return {'data': {second_level_key: {table: [] for table in TABLES}}}
+        return {'data': {second_level_key: self._read(dataset_id, chromosome, scope_id)}}
+
+
+    def gene_ids(self) -> Dict[str, Dict[str, str]]:
+        """Get the Ensembl IDs of the mirrored gene symbols, as {reference genome: {symbol: Ensembl ID}}."""
+        with self._lock:
+            return {reference_genome: dict(ids) for reference_genome, ids in self._manifest['gene_ids'].items()}
+
+
+    def mirror(self, search_objects: Iterable[Any]):
+        """Fetch the full data of region, gene and transcript searches from gnomAD and store it.
+
+        Only the parts of regions not mirrored yet are requested (in tiles, as the region searches do), and genes or
+        transcripts already mirrored are skipped. Other searches are ignored.
+
+        Args:
+            search_objects: The RegionSearch, GeneSearch and TranscriptSearch objects to be mirrored.
+
+        Raises:
+            Exception: If gnomAD returns no data for a search.
+        """
+        from pynoma.Search import RegionSearch, GeneSearch, TranscriptSearch
+        for obj in search_objects:
+            if isinstance(obj, RegionSearch):
+                self._mirror_region(obj)
+            elif isinstance(obj, GeneSearch):
+                if obj.gene_ens_id or obj.get_ensembl_id():
+                    self._mirror_scope(obj, obj.gene_ens_id, 'gene')
+                    self._add_gene_id(obj.reference_genome, obj.gene, obj.gene_ens_id)
+            elif isinstance(obj, TranscriptSearch):
+                self._mirror_scope(obj, obj.transcript, 'transcript')
+        return
+
+
+    def clear(self):
+        """Remove every mirrored variant."""
+        import shutil
+        with self._lock:
+            for table in TABLES:
+                shutil.rmtree(os.path.join(self.path, table), ignore_errors=True)
+            self._manifest = {'regions': {}, 'scopes': {}, 'gene_ids': {}}
+            self._save_manifest()
+        return
+
+
+    def _mirror_region(self, obj: Any):
+        from pynoma.Search import RegionSearch
+        for start, end in self.missing(obj.dataset_id, obj.chromosome, int(obj.start), int(obj.end)):
+            search = RegionSearch(obj.dataset_id, obj.chromosome, start, end, obj.tile_size, obj.tile_workers)
+            search._set_projection(standard=False)
+            region = self._get_response_data(search.get_json(), 'region')
+            with self._lock:
+                self._write(obj.dataset_id, obj.chromosome, REGION_SCOPE, region)
+                intervals = self._manifest['regions'].setdefault(obj.dataset_id, {}).setdefault(obj.chromosome, [])
+                intervals[:] = self._merge_intervals(intervals + [[start, end]])
+                self._save_manifest()
+        return
+
+
+    def _mirror_scope(self, obj: Any, scope_id: str, second_level_key: str):
+        if self.get_scope(obj.dataset_id, scope_id, second_level_key) is not None:
+            return
+        obj._set_projection(standard=False)
+        data = self._get_response_data(obj.request_gnomad(obj._get_variables()), second_level_key)
+
+        # Genes and transcripts are stored in the partition of the chromosome of their variants
+        chromosome = None
+        for table in TABLES:
+            for item in data.get(table) or []:
+                chromosome = item['variant_id'].split('-')[0]
+                break
+            if chromosome:
+                break
+        with self._lock:
+            if chromosome:
+                self._write(obj.dataset_id, chromosome, scope_id, data)
+            self._manifest['scopes'].setdefault(obj.dataset_id, {})[scope_id] = chromosome
+            self._save_manifest()
+        return
+
+
+    def _add_gene_id(self, reference_genome: str, symbol: str, gene_id: str):
+        if symbol.upper() == gene_id.upper():
+            return
+        with self._lock:
+            ids = self._manifest['gene_ids'].setdefault(reference_genome, {})
+            if ids.get(symbol.upper()) != gene_id:
+                ids[symbol.upper()] = gene_id
+                self._save_manifest()
+        return
+
+
+    @staticmethod
+    def _get_response_data(json_data: Dict[str, Any], second_level_key: str) -> Dict[str, Any]:
+        data = (json_data.get('data') or {}).get(second_level_key)
+        if not data:
+            raise Exception(f"gnomAD returned no {second_level_key} data to be mirrored: {json_data.get('errors')}")
+        return data
+
+
+    def _write(self, dataset_id: str, chromosome: str, scope: str, data: Dict[str, Any]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        for table in TABLES:
+            items = sorted(data.get(table) or [], key=lambda item: item['pos'])
+            if not items:
+                continue
+            columns = pa.table({
+                'scope': pa.array([scope] * len(items), type=pa.string()),
+                'pos': pa.array([item['pos'] for item in items], type=pa.int64()),
+                'variant_id': pa.array([item['variant_id'] for item in items], type=pa.string()),
+                'record': pa.array([json.dumps(item, separators=(',', ':')) for item in items], type=pa.string())
+            })
+            directory = self._partition(table, dataset_id, chromosome)
+            os.makedirs(directory, exist_ok=True)
+            name = f"part-{uuid.uuid4().hex}.parquet"
+            temporary_path = os.path.join(directory, f".{name}.tmp")   # hidden from readers until complete
+            pq.write_table(columns, temporary_path, row_group_size=self.row_group_size, compression='zstd')
+            os.replace(temporary_path, os.path.join(directory, name))
+        return
+
+
+    def _read(self,
+              dataset_id: str,
+              chromosome: str,
+              scope: str,
+              start: Optional[int] = None,
+              end: Optional[int] = None
+              ) -> Dict[str, List[Dict[str, Any]]]:
+        import pyarrow.dataset as ds
+
+        condition = ds.field('scope') == scope
+        if start is not None:
+            condition = condition & (ds.field('pos') >= start) & (ds.field('pos') <= end)
+
+        data = {}
+        for table in TABLES:
+            directory = self._partition(table, dataset_id, chromosome)
+            if not os.path.isdir(directory):
+                data[table] = []
+                continue
+            dataset = ds.dataset(directory, format='parquet')
+            rows = dataset.to_table(columns=['pos', 'record'], filter=condition).sort_by('pos')
+            data[table] = json.loads('[' + ','.join(rows.column('record').to_pylist()) + ']')   # a single parse
+        return data
+
+
+    def _partition(self, table: str, dataset_id: str, chromosome: str) -> str:
+        return os.path.join(self.path, table, f"dataset={dataset_id}", f"chromosome={chromosome}")
+
+
+    def _save_manifest(self):
+        with open(self._manifest_path + '.tmp', 'w') as file:
+            json.dump(self._manifest, file)
+        os.replace(self._manifest_path + '.tmp', self._manifest_path)
+        return
+
+
+    @staticmethod
+    def _merge_intervals(intervals: List[List[int]]) -> List[List[int]]:
+        merged: List[List[int]] = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
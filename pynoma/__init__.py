@@ -3,5 +3,24 @@ from .Search import RegionSearch
 from .Search import VariantSearch
 from .Search import GeneSearch
 from .Search import TranscriptSearch
+from .BatchSearch import BatchSearch
+from .BatchSearch import VariantBatchSearch
+from .BatchSearch import prefetch_gene_ids
+from .GeneIdMap import GeneIdMap
+from .GeneIndex import GeneIndex
+from .Annotator import VariantAnnotator
+from .AsyncSearch import AsyncRegionSearch
+from .AsyncSearch import AsyncVariantSearch
+from .AsyncSearch import AsyncGeneSearch
+from .AsyncSearch import AsyncTranscriptSearch
 from .helper import annotation_barplot
-from .helper import batch_search
\ No newline at end of file
+from .helper import batch_search
+from .helper import compact_dataframe
+from .helper import index_by_variant_key
+from .Transport import Transport
+from .Transport import AsyncTransport
+from .RateLimiter import RateLimiter
+from .RetryPolicy import RetryPolicy
+from .ResponseCache import ResponseCache
+from .RegionCache import RegionCache
+from .VariantStore import VariantStore
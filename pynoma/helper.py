@@ -1,10 +1,14 @@
+from pynoma.BatchSearch import coalesce_region_searches, resolve_gene_ids
 from pynoma.Logger import Logger
+from pynoma.Search import GeneSearch
+from pynoma.VariantColumns import variant_keys
 from matplotlib import style
 import matplotlib.pyplot as plt
 import seaborn as sns; sns.set()
+import numpy as np
 import pandas as pd
 
-from random import uniform
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from time import sleep
 
 
@@ -24,27 +28,136 @@ def annotation_barplot(df, path=None):
 
 # search_objects: a list of Search objects different from VariantSearch, i.e,
 # a list of GeneSearch, RegionSearch and/or TranscriptSearch objects
-def batch_search(search_objects, standard=True, additional_population_info=False, verbose=True):
-    datasets=[]
+# max_workers: the number of searches run concurrently. With the default of 1,
+# the searches run one at a time; with more workers they run in a thread pool
+# (sharing the pooled connections) and the resulting dataframes are still
+# concatenated in the input order. Either way, the requests are paced by the
+# rate limiter shared by all searches (see Search.set_rate_limiter)
+# ignore_errors: if True, failed searches are logged and left out of the result
+# instead of raising the first error once every search is done
+# compact: if True, the concatenated dataframe is converted with
+# compact_dataframe (see below)
+# key_index: if True, the concatenated dataframe is indexed by its packed
+# variant keys (see index_by_variant_key below)
+# region_gap: region searches of the same chromosome that overlap or are at
+# most this many bases apart are fetched together, in a single span, and each
+# one gets its own variants back (see BatchSearch.coalesce_region_searches).
+# If None, every region is fetched by itself
+def batch_search(search_objects, standard=True, additional_population_info=False, verbose=True,
+                 max_workers=1, ignore_errors=False, compact=False, key_index=False, region_gap=1000):
+    search_objects = list(search_objects)
+    resolve_gene_ids(search_objects)
+    coalesced = []
+    if region_gap is not None:
+        coalesced = coalesce_region_searches(search_objects, standard, additional_population_info,
+                                             region_gap, max_workers)
+    try:
+        if max_workers > 1:
+            datasets = _parallel_batch_search(search_objects, standard, additional_population_info, verbose,
+                                              max_workers, ignore_errors)
+        else:
+            datasets = _sequential_batch_search(search_objects, standard, additional_population_info, verbose,
+                                                ignore_errors)
+    finally:
+        for obj in coalesced:
+            obj.__dict__.pop('region_cache', None)   # back to the cache shared by all region searches, if any
+
+    datasets = [obj_df for obj_df in datasets if isinstance(obj_df, pd.DataFrame)]
+    if len(datasets) == 0:
+        return None
+
+    df = pd.concat(datasets)#.fillna(0)
+    if compact:
+        df = compact_dataframe(df, verbose)
+    if key_index:
+        df = index_by_variant_key(df)
+    return df
+
+
+# Returns the dataframe indexed by the int64 key packed from each Variant ID
+# (chromosome code, position and a hash of the ID; see
+# VariantColumns.variant_keys). Joining, deduplicating and sorting batches by
+# this index are integer operations, and sorting it orders the variants by
+# chromosome and position
+def index_by_variant_key(df):
+    return df.set_index(pd.Index(variant_keys(df['Variant ID']), name='Variant Key'))
+
+
+COMPACT_CATEGORICAL_COLUMNS = ['Gene', 'Annotation', 'Source', 'Chromosome', 'Reference', 'Alternative']
+COMPACT_INTEGER_COLUMNS = ['Location', 'Allele Count', 'Allele Number',
+                           'Number of Homozygotes', 'Number of Hemizygotes']
+
+
+# Returns a copy of a standard dataframe (or of a batch of them) taking much
+# less memory: the low-cardinality text columns become categoricals, and the
+# positions and counts become int32 (the nullable Int32 where values are
+# missing, e.g. the hemizygotes of autosomal variants in mixed batches). The
+# other columns are kept as they are. It should be applied to the final
+# (concatenated) dataframe, since concatenating dataframes with different
+# categories turns the categorical columns back into text
+# verbose: if True, the memory footprint before and after is logged
+def compact_dataframe(df, verbose=True):
+    compact_columns = {}
+    for column in COMPACT_CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            compact_columns[column] = df[column].astype('category')
+    for column in COMPACT_INTEGER_COLUMNS:
+        if column in df.columns:
+            values = pd.to_numeric(df[column])
+            dtype = 'Int32' if values.isna().any() else np.int32
+            compact_columns[column] = values.astype(dtype)
+
+    compact_df = df.assign(**compact_columns)
+    if verbose:
+        Logger.dataframe_memory_usage(df.memory_usage(deep=True).sum(),
+                                      compact_df.memory_usage(deep=True).sum())
+    return compact_df
+
+
+def _sequential_batch_search(search_objects, standard, additional_population_info, verbose, ignore_errors):
+    datasets = []
     total_searches = len(search_objects)
     for i, obj in enumerate(search_objects):
         if verbose:
             Logger.batch_searching(i+1, total_searches)
-        sleep(uniform(1,5))
         try:
-            obj_df, _ = obj.get_data(standard=standard, additional_population_info=additional_population_info) 
-            if isinstance(obj_df, pd.DataFrame):
-                datasets.append(obj_df)
+            datasets.append(_run_search(obj, standard, additional_population_info))
         except Exception as e:
-            if type(e).__name__ == 'KeyError':
-                sleep(30)
-                obj_df, _ = obj.get_data(standard=standard, additional_population_info=additional_population_info) 
-                if isinstance(obj_df, pd.DataFrame):
-                    datasets.append(obj_df)
-            else:
+            if not ignore_errors:
                 raise(e)
-                
-    if len(datasets) == 0:
-        return None
+            Logger.batch_search_failed(i+1, e)
+    return datasets
+
+
+def _parallel_batch_search(search_objects, standard, additional_population_info, verbose, max_workers,
+                           ignore_errors):
+    total_searches = len(search_objects)
+    datasets = [None] * total_searches
+    errors = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_run_search, obj, standard, additional_population_info): i
+                   for i, obj in enumerate(search_objects)}
+        for done, future in enumerate(as_completed(futures)):
+            i = futures[future]
+            if verbose:
+                Logger.batch_searching(done+1, total_searches)
+            try:
+                datasets[i] = future.result()
+            except Exception as e:
+                Logger.batch_search_failed(i+1, e)
+                errors.append((i, e))
+
+    if errors and not ignore_errors:
+        raise(min(errors, key=lambda error: error[0])[1])
+    return datasets
+
 
-    return pd.concat(datasets)#.fillna(0)
\ No newline at end of file
+def _run_search(obj, standard, additional_population_info):
+    if isinstance(obj, GeneSearch) and not obj.gene_ens_id:
+        return None   # gene not found when resolving the batch's gene IDs
+    try:
+        obj_df, _ = obj.get_data(standard=standard, additional_population_info=additional_population_info)
+    except KeyError:
+        sleep(30)
+        obj_df, _ = obj.get_data(standard=standard, additional_population_info=additional_population_info)
+    return obj_df
@@ -15,6 +15,10 @@ setup(
           'requests>=2.24.0',
           'seaborn'
       ],
+  extras_require={
+          'async': ['aiohttp>=3.8'],
+          'parquet': ['pyarrow>=7.0']
+      },
   classifiers=[
     'Development Status :: 3 - Alpha',      
     'Intended Audience :: Developers',      